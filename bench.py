@@ -0,0 +1,253 @@
+"""
+Benchmark the Hua Rong Dao solvers on the layouts in layouts/.
+
+Each (layout, algorithm) run happens in a fresh interpreter so that wall
+time and peak RSS are measured per run. Every run is repeated and its best
+time kept, so noise does not read as a regression. Results are printed as
+a table and can be saved as JSON and compared with a saved baseline:
+
+    python bench.py --output baseline.json
+    ... change the solver ...
+    python bench.py --baseline baseline.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import hrd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# algo:engine pairs run by default, see hrd.solve. idastar:board takes
+# minutes on the hard layouts and is left to --runs.
+DEFAULT_RUNS = [
+    "astar:board",
+    "astar:packed",
+    "astar:inplace",
+    "astar:generic",
+    "bidir:packed",
+    "external:packed",
+    "anytime:packed",
+    "dfs:board",
+    "dfs:packed",
+    "dfs:inplace",
+    "table:packed",
+]
+if hrd.numpy is not None:
+    DEFAULT_RUNS.append("bfs:packed")
+
+
+def run_one(layout, algo, engine, heuristic):
+    """
+    Solve one layout in this process and return its measurements.
+    Tables the run needs are loaded before the clock starts.
+    """
+    board = hrd.read_from_file(layout)
+    if algo == "table":
+        hrd.PatternDatabase.load("exact", board.getKey(), hrd.PDB_DIR)
+    if heuristic == "pdb":
+        for pattern in hrd.PatternDatabase.HEURISTICS:
+            hrd.PatternDatabase.load(pattern, board.getKey(), hrd.PDB_DIR)
+    start = time.perf_counter()
+    solvers = hrd.search(board, os.devnull, algo, engine, False, heuristic, hrd.PDB_DIR, None)
+    seconds = time.perf_counter() - start
+    return {
+        "status": "solved" if solvers.depth is not None else "unsolved",
+        "time": seconds,
+        "expanded": solvers.step,
+        "frontier_peak": solvers.frontier_peak,
+        "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "depth": solvers.depth,
+    }
+
+
+def run_isolated(layout, algo, engine, heuristic, timeout, repeat=1):
+    """
+    Run run_one in a fresh interpreter repeat times and return the result
+    dict of the fastest run, with the peak RSS of all of them and the time
+    of every run in "times".
+    """
+    base = {
+        "layout": os.path.splitext(os.path.basename(layout))[0],
+        "algo": algo,
+        "engine": engine,
+        "heuristic": heuristic,
+    }
+    command = [sys.executable, os.path.abspath(__file__), "--one", layout, algo, engine, heuristic]
+    best = None
+    times = []
+    for _ in range(repeat):
+        try:
+            done = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            base["status"] = "timeout"
+            return base
+        if done.returncode != 0:
+            lines = done.stderr.strip().splitlines()
+            base["status"] = "error: " + (lines[-1] if lines else str(done.returncode))
+            return base
+        result = json.loads(done.stdout.strip().splitlines()[-1])
+        times.append(result["time"])
+        if best is not None:
+            result["rss_kb"] = max(result["rss_kb"], best["rss_kb"])
+            if result["time"] >= best["time"]:
+                result["time"] = best["time"]
+        best = result
+    base.update(best)
+    base["times"] = times
+    return base
+
+
+def result_id(result):
+    return (result["layout"], result["algo"], result["engine"], result["heuristic"])
+
+
+def spread(result):
+    """
+    The gap between the slowest and the fastest repeat of a run, 0 for
+    runs saved without their repeat times.
+    """
+    times = result.get("times") or [result["time"]]
+    return max(times) - min(times)
+
+
+def print_results(results, baseline=None, threshold=0.1, min_time=0.05, expanded_threshold=0.05):
+    """
+    Print one line per run. With a baseline, add the time and expansion
+    ratios against the matching baseline run and flag regressions. A run
+    is only slower if its best time grew by more than threshold and by
+    more than the noise, taken as the larger of min_time seconds and the
+    spread of the repeats of either run. It only expands more if that
+    grew by more than expanded_threshold, so tie-breaking changes in the
+    anytime and hda searches pass.
+    Returns the number of regressions.
+    """
+    before = {}
+    if baseline is not None:
+        before = {result_id(r): r for r in baseline["results"]}
+    header = "{:<16} {:<6} {:<8} {:<9} {:>5} {:>9} {:>9} {:>9} {:>9}".format(
+        "layout", "algo", "engine", "heuristic", "depth", "time(s)", "expanded", "frontier", "rss(KB)")
+    if before:
+        header += "  {:>7} {:>7}".format("time x", "exp x")
+    print(header)
+    regressions = 0
+    for r in results:
+        if r["status"] != "solved":
+            print("{:<16} {:<6} {:<8} {:<9} {}".format(r["layout"], r["algo"], r["engine"], r["heuristic"], r["status"]))
+            continue
+        line = "{:<16} {:<6} {:<8} {:<9} {:>5} {:>9.3f} {:>9} {:>9} {:>9}".format(
+            r["layout"], r["algo"], r["engine"], r["heuristic"], r["depth"], r["time"],
+            r["expanded"], r["frontier_peak"], r["rss_kb"])
+        old = before.get(result_id(r))
+        if old is not None and old.get("status") == "solved":
+            time_ratio = r["time"] / old["time"] if old["time"] else 1.0
+            expanded_ratio = r["expanded"] / old["expanded"] if old["expanded"] else 1.0
+            line += "  {:>7.2f} {:>7.2f}".format(time_ratio, expanded_ratio)
+            noise = max(min_time, spread(r), spread(old))
+            slower = time_ratio > 1 + threshold and r["time"] - old["time"] > noise
+            if slower or expanded_ratio > 1 + expanded_threshold or r["depth"] != old["depth"]:
+                line += "  REGRESSION"
+                regressions += 1
+        print(line)
+        sys.stdout.flush()
+    return regressions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--one":
+        print(json.dumps(run_one(*sys.argv[2:6])))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--layouts",
+        type=str,
+        default=os.path.join(HERE, "layouts"),
+        help="A directory or glob of layouts in the read_from_file format."
+    )
+    parser.add_argument(
+        "--runs",
+        type=str,
+        default=",".join(DEFAULT_RUNS),
+        help="Comma separated algo:engine pairs to run on every layout."
+    )
+    parser.add_argument(
+        "--heuristic",
+        type=str,
+        default="manhattan",
+        choices=['manhattan', 'pdb'],
+        help="The A* heuristic."
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=300,
+        help="Seconds allowed per run."
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        help="Save the results as JSON to this file."
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        help="A JSON file saved with --output to compare against."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown against the baseline reported as a regression."
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.05,
+        help="Seconds a run must also slow down by to be reported as a regression, "
+             "raised to the spread of its repeat times when that is larger."
+    )
+    parser.add_argument(
+        "--expanded-threshold",
+        type=float,
+        default=0.05,
+        help="Relative growth in expansions against the baseline reported as a regression."
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Times to run each (layout, algorithm); the best time is kept."
+    )
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be positive")
+
+    layouts = hrd.batch_inputs(args.layouts)
+    results = []
+    for layout in layouts:
+        for run in args.runs.split(","):
+            algo, engine = run.split(":")
+            results.append(run_isolated(layout, algo, engine, args.heuristic, args.timeout, args.repeat))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = print_results(results, baseline, args.threshold, args.min_time, args.expanded_threshold)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, f, indent=1)
+    sys.exit(1 if regressions else 0)
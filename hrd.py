@@ -1,12 +1,29 @@
 import copy
 from copy import deepcopy
-from heapq import heappush, heappop # min-heap
+from heapq import heappush, heappop, heapify, merge # min-heap
 import itertools # tie breaking for heap
 import time
 import argparse
+import asyncio
+import concurrent.futures
+import contextlib
 import sys
 import os
 import glob
+import multiprocessing
+import mmap
+import sqlite3
+import shutil
+import tempfile
+import json
+import math
+import struct
+from array import array
+from bisect import bisect_left
+try:
+    import numpy # only needed by the layered BFS (--algo bfs)
+except ImportError:
+    numpy = None
 sys.setrecursionlimit(1000000)
 
 #====================================================================================
@@ -67,6 +84,7 @@ class Board:
         # A grid contains the symbol for representing the pieces on the board.
         self.grid = []
         self.__construct_grid()
+        self.__index_pieces()
 
 
     def __construct_grid(self):
@@ -97,6 +115,36 @@ class Board:
                     self.grid[piece.coord_y][piece.coord_x] = '^'
                     self.grid[piece.coord_y + 1][piece.coord_x] = 'v'
 
+    def __index_pieces(self):
+        """
+        Called after __construct_grid to set up what legal_moves looks up:
+        self.blanks, the cell mask (1 bit per cell) of the empty cells, and
+        self.origins, mapping the (x, y) origin of every piece to its
+        (index, type). Board.move keeps both up to date.
+        """
+        self.blanks = 0
+        for y, line in enumerate(self.grid):
+            for x, ch in enumerate(line):
+                if ch == '.':
+                    self.blanks |= 1 << (y * WIDTH + x)
+        self.origins = {}
+        for i, piece in enumerate(self.pieces):
+            self.origins[piece.coord_x, piece.coord_y] = (i, board_type(piece))
+
+    def __deepcopy__(self, memo):
+        """
+        Copy the grid rows, the pieces and the lookup tables directly
+        instead of walking every object like the generic deepcopy does.
+        """
+        board = Board.__new__(Board)
+        board.width = self.width
+        board.height = self.height
+        board.pieces = [Piece(p.is_goal, p.is_single, p.coord_x, p.coord_y, p.orientation) for p in self.pieces]
+        board.grid = [list(row) for row in self.grid]
+        board.blanks = self.blanks
+        board.origins = dict(self.origins)
+        return board
+
     def getStringRep(self):
         res = ""
         for row in self.grid:
@@ -104,6 +152,13 @@ class Board:
                 res = res + ele
         return res
 
+    def getKey(self):
+        """
+        Return the packed integer key of the board (see pack_grid).
+        Like getStringRep, pieces of the same type are not distinguished.
+        """
+        return pack_grid(self.grid)
+
     def move(self, pieces, i, type, dir):
         """
         Move a piece from (srcY, srcX) to (desY, desX) (upper left)
@@ -210,6 +265,9 @@ class Board:
                 grid[y][x] = "."
                 grid[y][x+1] = "2"
                 piece.coord_x = x + 1
+        freed, filled = SHAPE_SWEEP[type, y * WIDTH + x, dir]
+        self.blanks = self.blanks & ~filled | freed
+        self.origins[piece.coord_x, piece.coord_y] = self.origins.pop((x, y))
         return self
 
     def display(self):
@@ -224,17 +282,48 @@ class Board:
     
     def find_empty(self):
         """
-        Find the two empty spaces on the board, return their positions
-        [(x1, y1), (x2, y2)]
+        Find the empty spaces on the board, return their positions
+        [(y1, x1), (y2, x2)] in row-major order.
 
         """
         res = []
-        for i, line in enumerate(self.grid):
-            for x, ch in enumerate(line):
-                if ch == ".":
-                    res.append((i,x))                    
+        for c in range(self.width * self.height):
+            if self.blanks >> c & 1:
+                res.append((c // WIDTH, c % WIDTH))
         return res
-    
+
+    def legal_moves(self):
+        """
+        Search all possible ways to move the pieces.
+        Return a list of (piece index, type, dir) usable with Board.move.
+        The moves that can fill the current blanks come from a precomputed
+        table (see board_moves), so only a handful of origins are checked.
+        """
+        origins = self.origins
+        moves = []
+        for origin, type, dir in board_moves(self.blanks):
+            found = origins.get(origin)
+            if found is not None and found[1] == type:
+                moves.append((found[0], type, dir))
+        return moves
+
+    def undo(self, pieces, i, type, dir):
+        """
+        Take back a move made with Board.move(pieces, i, type, dir).
+        """
+        return self.move(pieces, i, type, OPPOSITE[dir])
+
+    def load_key(self, key):
+        """
+        Reset this board in place to the position of a packed key.
+        """
+        board = board_from_key(key)
+        self.grid = board.grid
+        self.pieces = board.pieces
+        self.blanks = board.blanks
+        self.origins = board.origins
+        return self
+
     def manhattan(self):
         """
         Returns the vertical distance of the goal piece from goal position.
@@ -276,315 +365,3300 @@ class State:
         self.parent = parent
         self.id = hash(board)  # The id for breaking ties.
 
-def trace_sol(self, filename):
+    def trace_path(self):
+        """
+        Return the states from the start to this one, following parent.
+        """
         path = []
-        f = open(filename, "a")
         while self.parent:
             path.append(self)
             self = self.parent
         path.append(self)
-        path = path[::-1]
-        for states in (path):    
-            for i, line in enumerate(states.board.grid):
-                for ch in line:
-                    f.write(ch) # ends with a new line
-                f.write("\n")
-            f.write("\n")
-            
-
-class Solvers:
-    def __init__(self, startState, endState=None):
-        self.startState = startState
-        self.endState = endState
-        self.currentState = startState
-        self.frontierList = []       # contains state
-        self.exploredSet = set()       # for pruning
-        self.step = 0
+        return path[::-1]
 
-    def checkGoal(self) -> bool:
-        """
-        Check whether currentState is the goal """
-        board = self.currentState.board
-        grid = board.grid
-        if (grid[3][1] == "1" and
-            grid[4][1] == "1" and
-            grid[3][2] == "1" and
-            grid[4][2] == "1"):
-            return True
-        return False
-
-    def add_successor(self, i, type ,dir, algo):
+    def trace_sol(self, filename, format="grids"):
         """
-        Deep copy the current state, move the newState, and add it to the frontier
+        Write the path from the start to this state to filename
+        (see solution_lines for the formats).
         """
-        if algo == "DFS":
-            newBoard = deepcopy(self.currentState.board)
-            newBoard = newBoard.move(newBoard.pieces, i, type, dir)
-            new_str = newBoard.getStringRep()
-            if new_str not in self.exploredSet:
-                self.frontierList.append(State(newBoard, 0, self.currentState.depth + 1, self.currentState))
-        elif algo == "A*":
-            newBoard = deepcopy(self.currentState.board)
-            newBoard = newBoard.move(newBoard.pieces, i, type, dir)
-            new_str = newBoard.getStringRep()
-            if new_str not in self.exploredSet:
-                f = newBoard.manhattan() + self.currentState.depth
-                id = hash(newBoard)
-                heappush(self.frontierList, (f, id, State(newBoard, f, self.currentState.depth + 1, self.currentState)))
+        keys_to_file([state.board.getKey() for state in self.trace_path()], filename, format)
 
 
-    
-    def move_near(self, algo) -> None:
-        """
-        Search all possible ways to move the pieces, and move them,
-        Add the state into the frontier.
-        algo == "DFS" or "A*"
-        """
-        board = self.currentState.board
-        grid = board.grid
-        e = board.find_empty()    #lower row first
-        e1y = e[0][0]
-        e1x = e[0][1]
-        e2y = e[1][0]
-        e2x = e[1][1]
-        pieces = board.pieces
-        for i in range(len(pieces)):
-            piece = pieces[i]
-            px = piece.coord_x
-            py = piece.coord_y
-            if piece.orientation == "h" and grid[py][px+1] == ">":
-                if (py == e1y and px == e1x + 1) or (py == e2y and px == e2x + 1):
-                    self.add_successor(i, "h" ,"left", algo)
-                if (py == e1y and px == e1x - 2) or (py == e2y and px == e2x - 2):
-                    self.add_successor(i, "h" ,"right", algo)
-                if(py == e1y - 1 and px == e1x and e2x == e1x + 1 and e2y == e1y):
-                    self.add_successor(i, "h" ,"down", algo)
-                if (py == e1y + 1 and px == e1x and e2x == e1x + 1 and e2y == e1y):
-                    self.add_successor(i, "h" ,"up", algo)
-
-            if piece.is_single and grid[py][px] == "2":
-                if (py == e1y - 1 and px == e1x) or (py == e2y - 1 and px == e2x):
-                    self.add_successor(i, "2" ,"down", algo)
-                if (py == e1y + 1 and px == e1x) or (py == e2y + 1 and px == e2x):
-                    self.add_successor(i, "2" ,"up", algo)
-                if (py == e1y and px == e1x + 1) or (py == e2y and px == e2x + 1):
-                    self.add_successor(i, "2" ,"left", algo)
-                if (py == e1y and px == e1x - 1) or (py == e2y and px == e2x - 1):
-                    self.add_successor(i, "2" ,"right", algo)
-            
-            if piece.orientation == "v" and grid[py+1][px] == "v":
-                if (py == e1y - 2 and px == e1x) or (py == e2y - 2 and px == e2x):
-                    self.add_successor(i, "v" ,"down", algo)
-                if (py == e1y + 1 and px == e1x) or (py == e2y + 1 and px == e2x):
-                    self.add_successor(i, "v" ,"up", algo)
-                if (py == e1y and px == e1x + 1 and e2y == e1y + 1 and e2x == e1x):
-                    self.add_successor(i, "v" ,"left", algo)
-                if (py == e1y and px == e1x - 1 and e2y == e1y + 1 and e2x == e1x):
-                    self.add_successor(i, "v" ,"right", algo)
-
-            if piece.is_goal and grid[py][px+1] == "1" and grid[py+1][px] == "1" and grid[py+1][px+1] == "1":
-                # if we can move right
-                if (py == e1y and px == e1x - 2 and e2y == e1y + 1 and e2x == e1x): 
-                    self.add_successor(i, "1" ,"right", algo)
-                # if we can move left
-                if (py == e1y and px == e1x + 1 and e2y == e1y + 1 and e2x == e1x):
-                    self.add_successor(i, "1" ,"left", algo)
-                # if we can move down
-                if (py == e1y - 2 and px == e1x and e2x == e1x + 1 and e2y == e1y):
-                    self.add_successor(i, "1" ,"down", algo)
-                # if we can move up
-                if (py == e1y + 1 and px == e1x and e2x == e1x + 1 and e2y == e1y):
-                    self.add_successor(i, "1" ,"up", algo)
+#====================================================================================
+# Packed state encoding
+#
+# A board is packed into a single int, 3 bits per cell in row-major order
+# (cell c = y * WIDTH + x lives in bits [3c, 3c + 3)). The cell codes are the
+# grid characters, so a key maps 1-1 to getStringRep(). Moves are applied by
+# subtracting the packed piece at its old origin and adding it at the new one,
+# so successors are generated without building any Board or Piece objects.
 
+WIDTH = 4
+HEIGHT = 5
+CELLS = WIDTH * HEIGHT
 
+GLYPHS = '.12<>^v'
+CODE = {ch: code for code, ch in enumerate(GLYPHS)}
+CODE_GOAL = CODE[char_goal]
+CODE_SINGLE = CODE[char_single]
 
-    def run_A_star(self, outputfile):
-        """
-        A* algorithm with Manhattan heuristics to find the optimal solution.
-        frontierList is a min heap containing:
-        (Manhattan heuristic value, state object)
+# Piece shapes as (dx, dy, glyph) cells relative to the top left corner,
+# keyed by the type names used in Board.move.
+SHAPES = {
+    "1": ((0, 0, '1'), (1, 0, '1'), (0, 1, '1'), (1, 1, '1')),
+    "h": ((0, 0, '<'), (1, 0, '>')),
+    "v": ((0, 0, '^'), (0, 1, 'v')),
+    "2": ((0, 0, '2'),),
+}
 
-        Tie-breaking rule:
-        […] store entries as 3-element list including (the priority, an entry count, and the task). 
-        The entry count serves as a tie-breaker so that two tasks with the same priority are returned in 
-        the order they were added. And since no two entry counts are the same, the tuple comparison 
-        will never attempt to directly compare two tasks.
+DIRECTIONS = {"up": (0, -1), "down": (0, 1), "left": (-1, 0), "right": (1, 0)}
+OPPOSITE = {"up": "down", "down": "up", "left": "right", "right": "left"}
 
-        The alternative to an entry point is a state id which is a hash value of the board.
-        
-        """
-        # Update current state's heuristic value
-        self.currentState.f = self.currentState.board.manhattan()
-        # Push (f, state) into the frontier
-        heappush(self.frontierList, (self.currentState.f, self.currentState.id, self.currentState))
-        while self.frontierList:
-            # Pop the lowest heuristic state out of the frontier
-            _, _, curState = heappop(self.frontierList)
-            # Get string representation of the current state
-            cur_str = curState.board.getStringRep()
-            # Update current state for later function calls
-            self.currentState = curState
-            if cur_str not in self.exploredSet:
-                # Add current state to the explored set
-                self.exploredSet.add(cur_str)
-                # Check if current state is the goal state
-                if self.checkGoal():    
-                    # Output to file        
-                    self.currentState.trace_sol(outputfile)      
-                    return self.currentState.depth
-                # Find successors and add them to frontier
-                self.move_near("A*")
+# One marker bit per cell (the lowest of its three bits).
+LOW_BITS = sum(1 << (3 * c) for c in range(CELLS))
 
+GOAL_X = 1
+GOAL_Y = 3
 
-    def run_DFS(self, outputfile):
-        """
-        While frontier is not empty,
-        Pop a state out of frontier, add it to exploredSet
-        Check whether the goal is reach, if not,
-        Explore possibilities to move, and add them into the frontier.
-        """
-        self.frontierList.append(self.currentState)
-        start_str = self.currentState.board.getStringRep()
-        while len(self.frontierList) != 0:
-            # Pop the last state out of the frontier
-            curState = self.frontierList.pop(-1)   
-            cur_str = curState.board.getStringRep()
-            # Update current state for DFS
-            self.currentState = curState    
-            # Check if current state is the goal state
-            if self.checkGoal():            
-                    self.currentState.trace_sol(outputfile)        
-                    return
-            elif cur_str not in self.exploredSet:
-                # Add current state to the explored set
-                self.exploredSet.add(curState.board.getStringRep())
-                # Find successors and add them to frontier
-                self.move_near("DFS")
-        print("NOT found!")
 
-    def frontier_to_file(self, filename, algo):
-        f = open(filename, "a")
-        f.write("\nBegin frontier\n")
-        j = 0
-        if algo == "DFS":
-            for states in self.frontierList:    
-                f.write("%d \n" %(j))
-                for i, line in enumerate(states.board.grid):
-                    for ch in line:
-                        f.write(ch) # ends with a new line
-                    f.write("\n")
-                j += 1
-                f.write("\n")
-                if states.board.getStringRep() in self.exploredSet:
-                    f.write("NOOOOOOOOO\n")
-            f.write("frontier done")
-            f.close()
-        else:
-            for heu, _, states in self.frontierList:    
-                f.write("%d: %d\n\n" %(j,heu))
-                for i, line in enumerate(states.board.grid):
-                    for ch in line:
-                        f.write(ch) # ends with a new line
-                    f.write("\n")
-                j += 1
-                f.write("\n")
-                if states.board.getStringRep() in self.exploredSet:
-                    f.write("NOOOOOOOOO\n")
-            f.write("frontier done")
-            f.close()
-    
-    def output_to_file(self, state, filename):
-        """
-        Write state to file
-        """
-        f = open(filename, "a")
-        f.write("\n\nExploring:\n")
-        for i, line in enumerate(state.board.grid):
-            for ch in line:
-                f.write(ch) # ends with a new line
-            f.write("\n")
-        f.close()
-    
-    
-        f.close()
-        
+def _build_shape_tables():
+    """
+    For every shape and every origin cell it fits at, precompute the
+    cell mask (1 bit per cell) and the packed value of the piece.
+    Returns (shape_cells, shape_pack, shape_move), the last one mapping
+    (shape, origin, dir) to the new origin of a move that stays on the board.
+    """
+    shape_cells = {}
+    shape_pack = {}
+    shape_move = {}
+    for shape, cells in SHAPES.items():
+        w = max(dx for dx, _, _ in cells) + 1
+        h = max(dy for _, dy, _ in cells) + 1
+        for y in range(HEIGHT - h + 1):
+            for x in range(WIDTH - w + 1):
+                origin = y * WIDTH + x
+                mask = 0
+                value = 0
+                for dx, dy, ch in cells:
+                    c = (y + dy) * WIDTH + (x + dx)
+                    mask |= 1 << c
+                    value |= CODE[ch] << (3 * c)
+                shape_cells[shape, origin] = mask
+                shape_pack[shape, origin] = value
+                for dir, (mx, my) in DIRECTIONS.items():
+                    nx, ny = x + mx, y + my
+                    if 0 <= nx <= WIDTH - w and 0 <= ny <= HEIGHT - h:
+                        shape_move[shape, origin, dir] = ny * WIDTH + nx
+    return shape_cells, shape_pack, shape_move
 
-def read_from_file(filename):
+SHAPE_CELLS, SHAPE_PACK, SHAPE_MOVE = _build_shape_tables()
+
+GOAL_ORIGIN = GOAL_Y * WIDTH + GOAL_X
+GOAL_FIELD = sum(7 << (3 * c) for c in range(CELLS) if SHAPE_CELLS["1", GOAL_ORIGIN] >> c & 1)
+GOAL_VALUE = SHAPE_PACK["1", GOAL_ORIGIN]
+
+
+def _build_sweep_tables():
     """
-    Load initial board from a given file.
+    For every (shape, origin, dir) move, precompute the cells it frees and
+    the cells it fills (1 bit per cell masks). Returns (shape_sweep,
+    fill_moves), the latter listing for every cell the moves whose lowest
+    filled cell it is, so each move is found from exactly one blank.
+    """
+    shape_sweep = {}
+    fill_moves = [[] for c in range(CELLS)]
+    for (shape, origin, dir), dest in SHAPE_MOVE.items():
+        old = SHAPE_CELLS[shape, origin]
+        new = SHAPE_CELLS[shape, dest]
+        filled = new & ~old
+        shape_sweep[shape, origin, dir] = (old & ~new, filled)
+        fill_moves[(filled & -filled).bit_length() - 1].append((shape, origin, dir, filled))
+    return shape_sweep, fill_moves
 
-    :param filename: The name of the given file.
-    :type filename: str
-    :return: A loaded board
-    :rtype: Board
+SHAPE_SWEEP, FILL_MOVES = _build_sweep_tables()
+
+
+def cell_field(mask):
+    """
+    Return the packed key bits (7 per cell) of the cells in mask.
     """
+    return sum(7 << (3 * c) for c in range(CELLS) if mask >> c & 1)
 
-    puzzle_file = open(filename, "r")
 
-    line_index = 0
-    pieces = []
-    g_found = False
+def marker_cells(marks):
+    """
+    Turn a mask with one marker bit per cell (see LOW_BITS) into a cell mask.
+    """
+    mask = 0
+    while marks:
+        low = marks & -marks
+        mask |= 1 << ((low.bit_length() - 1) // 3)
+        marks ^= low
+    return mask
 
-    for line in puzzle_file:
 
-        for x, ch in enumerate(line):
-            if ch == '^': # found vertical piece
-                pieces.append(Piece(False, False, x, line_index, 'v'))
-            elif ch == '<': # found horizontal piece
-                pieces.append(Piece(False, False, x, line_index, 'h'))
-            elif ch == char_single:
-                pieces.append(Piece(False, True, x, line_index, None))
-            elif ch == char_goal:
-                if g_found == False:
-                    pieces.append(Piece(True, False, x, line_index, None))
-                    g_found = True
+def blank_moves(blanks):
+    """
+    Return every (type, origin, dir) move that only fills cells of blanks
+    (a cell mask). Each one is legal exactly when that piece is at origin.
+    """
+    moves = []
+    b = blanks
+    while b:
+        low = b & -b
+        b ^= low
+        for type, origin, dir, filled in FILL_MOVES[low.bit_length() - 1]:
+            if not filled & ~blanks:
+                moves.append((type, origin, dir))
+    return moves
 
-        line_index += 1
 
-    puzzle_file.close()
+# The moves into each set of blanks, as used by Board.legal_moves and
+# key_successors. Every position with two blanks is filled in at import;
+# other sets (abstract PDB keys, malformed boards) are added when first seen.
+BOARD_MOVES = {}
+KEY_MOVES = {}
 
-    board = Board(pieces)
-    
-    return board
 
+def board_moves(blanks):
+    """
+    Return the moves into blanks (a cell mask) as ((x, y), type, dir).
+    """
+    moves = BOARD_MOVES.get(blanks)
+    if moves is None:
+        moves = BOARD_MOVES[blanks] = [
+            ((origin % WIDTH, origin // WIDTH), type, dir) for type, origin, dir in blank_moves(blanks)
+        ]
+    return moves
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--inputfile",
-        type=str,
-        required=True,
-        help="The input file that contains the puzzle."
-    )
-    parser.add_argument(
-        "--outputfile",
-        type=str,
-        required=True,
-        help="The output file that contains the solution."
-    )
-    parser.add_argument(
-        "--algo",
-        type=str,
-        required=True,
-        choices=['astar', 'dfs'],
-        help="The searching algorithm."
-    )
-    args = parser.parse_args()
-    
-    board = read_from_file(args.inputfile)
-    state = State(board, 0, 0, None)
-    solvers = Solvers(state)
-    if args.algo == "dfs":
-        solvers.run_DFS(args.outputfile)
-    else:
-        solvers.run_A_star(args.outputfile)
-        
-        
-    
+def key_moves(marks):
+    """
+    Return the moves into the blanks marked in marks (one LOW_BITS bit per
+    empty cell) as (type, origin, dir, field, value, delta): the piece is at
+    origin when key & field == value, and key + delta is the moved key.
+    """
+    moves = KEY_MOVES.get(marks)
+    if moves is None:
+        moves = KEY_MOVES[marks] = []
+        for type, origin, dir in blank_moves(marker_cells(marks)):
+            value = SHAPE_PACK[type, origin]
+            delta = SHAPE_PACK[type, SHAPE_MOVE[type, origin, dir]] - value
+            moves.append((type, origin, dir, cell_field(SHAPE_CELLS[type, origin]), value, delta))
+    return moves
 
-    
 
+for _a, _b in itertools.combinations(range(CELLS), 2):
+    board_moves(1 << _a | 1 << _b)
+    key_moves(1 << (3 * _a) | 1 << (3 * _b))
+
+
+def pack_grid(grid):
+    """
+    Pack a grid (list of rows of characters) into an int key.
+    """
+    key = 0
+    shift = 0
+    for row in grid:
+        for ch in row:
+            key |= CODE[ch] << shift
+            shift += 3
+    return key
+
+
+def unpack_key(key):
+    """
+    Unpack an int key into a grid (list of rows of characters).
+    """
+    grid = []
+    for y in range(HEIGHT):
+        line = []
+        for x in range(WIDTH):
+            line.append(GLYPHS[(key >> (3 * (y * WIDTH + x))) & 7])
+        grid.append(line)
+    return grid
+
+
+def board_type(piece):
+    """
+    Return the type name Board.move uses for piece.
+    """
+    if piece.is_goal:
+        return "1"
+    if piece.is_single:
+        return "2"
+    return piece.orientation
+
+
+def board_from_key(key):
+    """
+    Build a Board (with its pieces) from a packed key.
+    """
+    return parse_board("".join(row) for row in unpack_key(key))
+
+
+def key_goal_origin(key):
+    """
+    Return the cell index of the top left corner of the goal piece.
+    The goal piece is the only one using code 1, and its first cell in
+    row-major order is its top left corner.
+    """
+    ones = key & ~(key >> 1) & ~(key >> 2) & LOW_BITS
+    return ((ones & -ones).bit_length() - 1) // 3
+
+
+def key_successors(key):
+    """
+    Generate every legal move from key as (type, origin, dir, new_key).
+    Only the moves into the current blanks are tried (see key_moves), each
+    one with a single mask test.
+    """
+    for type, origin, dir, field, value, delta in key_moves(LOW_BITS & ~(key | key >> 1 | key >> 2)):
+        if key & field == value:
+            yield type, origin, dir, key + delta
+
+
+def key_is_goal(key):
+    """
+    Same test as Solvers.checkGoal on a packed key.
+    """
+    return key & GOAL_FIELD == GOAL_VALUE
+
+
+def key_manhattan(key):
+    """
+    Same value as Board.manhattan on a packed key.
+    """
+    origin = key_goal_origin(key)
+    return abs(GOAL_X - origin % WIDTH) + abs(GOAL_Y - origin // WIDTH)
+
+
+# Paths longer than this are written in chunks of STREAM_STEPS positions
+# instead of being joined into one string first.
+STREAM_STEPS = 4096
+
+
+def key_move(key, new_key):
+    """
+    Return the (type, origin, dir) move leading from key to new_key.
+    """
+    for type, origin, dir, successor in key_successors(key):
+        if successor == new_key:
+            return type, origin, dir
+    raise ValueError("boards are not one move apart")
+
+
+def solution_lines(keys, format="grids"):
+    """
+    Generate the text of a solution path, one string per position.
+
+    "grids" writes every position as its rows followed by a blank line.
+    "moves" writes one "<type> <x> <y> <dir>" line per move, where type is
+    the Board.move type of the piece and (x, y) its top left corner
+    before the move.
+    """
+    if format == "moves":
+        for key, new_key in zip(keys, keys[1:]):
+            type, origin, dir = key_move(key, new_key)
+            yield "{} {} {} {}\n".format(type, origin % WIDTH, origin // WIDTH, dir)
+        return
+    for key in keys:
+        rep = key_rep(key)
+        yield "\n".join(rep[i:i + WIDTH] for i in range(0, CELLS, WIDTH)) + "\n\n"
+
+
+def keys_to_file(keys, filename, format="grids", puzzle=None):
+    """
+    Write a path of packed keys (or of keys of puzzle, see Puzzle) to
+    filename in one write, or for paths longer than STREAM_STEPS in one
+    write per chunk of STREAM_STEPS positions.
+    """
+    lines = solution_lines(keys, format) if puzzle is None else puzzle.solution_lines(keys, format)
+    with open(filename, "w") as f:
+        if len(keys) <= STREAM_STEPS:
+            f.write("".join(lines))
+            return
+        while True:
+            chunk = "".join(itertools.islice(lines, STREAM_STEPS))
+            if not chunk:
+                break
+            f.write(chunk)
+
+
+def same(rep):
+    """
+    Identity canonicalization, used when symmetry is off.
+    """
+    return rep
+
+
+MIRROR_CHARS = str.maketrans('<>', '><')
+
+
+def mirror_rep(rep):
+    """
+    Return the string rep of the left-right mirror image of rep.
+    """
+    return "".join(rep[i:i + WIDTH][::-1] for i in range(0, CELLS, WIDTH)).translate(MIRROR_CHARS)
+
+
+def canonical_rep(rep):
+    """
+    The goal region is symmetric about the vertical axis, so a board and
+    its mirror are the same distance from the goal. Use the smaller of the
+    two string reps as the key for both.
+    """
+    mirrored = mirror_rep(rep)
+    return mirrored if mirrored < rep else rep
+
+
+def _build_row_mirror():
+    """
+    Table from a packed row (3 * WIDTH bits) to its mirrored packed row.
+    """
+    swap = {CODE['<']: CODE['>'], CODE['>']: CODE['<']}
+    table = []
+    for row in range(1 << (3 * WIDTH)):
+        out = 0
+        for x in range(WIDTH):
+            code = (row >> (3 * x)) & 7
+            out |= swap.get(code, code) << (3 * (WIDTH - 1 - x))
+        table.append(out)
+    return table
+
+ROW_MIRROR = _build_row_mirror()
+ROW_BITS = 3 * WIDTH
+ROW_MASK = (1 << ROW_BITS) - 1
+
+
+def mirror_key(key):
+    """
+    Return the packed key of the left-right mirror image of key.
+    """
+    out = 0
+    for y in range(HEIGHT):
+        out |= ROW_MIRROR[(key >> (ROW_BITS * y)) & ROW_MASK] << (ROW_BITS * y)
+    return out
+
+
+def canonical_key(key):
+    """
+    Packed counterpart of canonical_rep.
+    """
+    mirrored = mirror_key(key)
+    return mirrored if mirrored < key else key
+
+
+#====================================================================================
+# Layered breadth first search
+#
+# A whole BFS layer is a sorted numpy array of packed keys (60 bits fit in a
+# uint64). Every move of the game is a (mask, value, delta) triple: it applies
+# to the keys with key & mask == value (the piece at its origin and the cells
+# it moves into empty), and the moved key is key + delta. Successors of a
+# layer are made by testing every key against every move at once.
+
+def _build_layer_moves():
+    """
+    Return the masks, values and deltas of every (shape, origin, dir) move
+    as three lists, with deltas taken modulo 2 ** 64 so uint64 additions
+    wrap to them.
+    """
+    masks = []
+    values = []
+    deltas = []
+    for (shape, origin, dir), dest in SHAPE_MOVE.items():
+        freed, filled = SHAPE_SWEEP[shape, origin, dir]
+        masks.append(cell_field(SHAPE_CELLS[shape, origin] | filled))
+        values.append(SHAPE_PACK[shape, origin])
+        deltas.append((SHAPE_PACK[shape, dest] - SHAPE_PACK[shape, origin]) % (1 << 64))
+    return masks, values, deltas
+
+if numpy is not None:
+    LAYER_MASKS, LAYER_VALUES, LAYER_DELTAS = (numpy.array(column, dtype=numpy.uint64)
+                                               for column in _build_layer_moves())
+    LAYER_MIRROR = numpy.array(ROW_MIRROR, dtype=numpy.uint64)
+
+
+def layer_successors(layer):
+    """
+    Return every successor of the keys of layer (a uint64 array), unsorted
+    and with repeats.
+    """
+    keys, moves = numpy.nonzero((layer[:, None] & LAYER_MASKS) == LAYER_VALUES)
+    return layer[keys] + LAYER_DELTAS[moves]
+
+
+def canonical_layer(layer):
+    """
+    canonical_key over a uint64 array of keys.
+    """
+    mirrored = numpy.zeros_like(layer)
+    for y in range(HEIGHT):
+        shift = numpy.uint64(ROW_BITS * y)
+        mirrored |= LAYER_MIRROR[(layer >> shift) & numpy.uint64(ROW_MASK)] << shift
+    return numpy.minimum(layer, mirrored)
+
+
+def key_counts(key):
+    """
+    Return how many pieces of each type ("h", "v", "2") key contains.
+    """
+    counts = {"h": 0, "v": 0, "2": 0}
+    for c in range(CELLS):
+        code = (key >> (3 * c)) & 7
+        if code == CODE['<']:
+            counts["h"] += 1
+        elif code == CODE['^']:
+            counts["v"] += 1
+        elif code == CODE_SINGLE:
+            counts["2"] += 1
+    return counts
+
+
+def placements(key, occupied, counts):
+    """
+    Generate every packed key obtained by adding pieces to key without
+    overlapping the occupied cell mask. counts is a list of (type, n);
+    pieces of one type are identical, so each type is placed in
+    increasing origin order.
+    """
+    if not counts:
+        yield key
+        return
+    type, n = counts[0]
+    if n == 0:
+        yield from placements(key, occupied, counts[1:])
+        return
+    yield from _place(key, occupied, type, n, 0, counts[1:])
+
+
+def _place(key, occupied, type, n, first, rest):
+    if n == 0:
+        yield from placements(key, occupied, rest)
+        return
+    for origin in range(first, CELLS):
+        cells = SHAPE_CELLS.get((type, origin))
+        if cells is not None and not cells & occupied:
+            yield from _place(key | SHAPE_PACK[type, origin], occupied | cells, type, n - 1, origin + 1, rest)
+
+
+def goal_keys(counts):
+    """
+    Generate every board with the goal piece at the exit and the other
+    pieces given by counts (a list of (type, n)).
+    """
+    return placements(GOAL_VALUE, SHAPE_CELLS["1", GOAL_ORIGIN], counts)
+
+
+def drop_singles(key):
+    """
+    Clear the cells of the 1x1 pieces (code 2) of key.
+    """
+    found = (key >> 1) & ~key & ~(key >> 2) & LOW_BITS
+    return key & ~(found * 7)
+
+
+def drop_dominoes(key):
+    """
+    Clear the cells of the 1x2 pieces (codes 3 to 6) of key.
+    """
+    found = ((key >> 2) | ((key >> 1) & key)) & LOW_BITS
+    return key & ~(found * 7)
+
+
+class PatternDatabase:
+    """
+    Exact distances to the goal in an abstraction of the puzzle that keeps
+    the goal piece and the pieces of some types, and treats the cells of the
+    other pieces as empty. Removing pieces only adds moves, so the distances
+    are admissible for A*.
+
+    The table is built once by a breadth-first search backwards from every
+    abstract goal board and saved as a header, the sorted abstract keys
+    (uint64) and one distance byte per key. Loading memory-maps the file
+    and looks keys up with bisect, so nothing is rebuilt at startup.
+    """
+
+    MAGIC = b"HRDPDB01"
+    HEADER = struct.Struct("<8sQ")
+    UNREACHABLE = 255
+    LABELS = {"h": "h", "v": "v", "2": "s"}
+
+    # pattern name -> (types kept, abstraction)
+    # "exact" keeps every piece: its table is the full retrograde analysis
+    # of the state space and gives the true distance of every board.
+    PATTERNS = {
+        "dominoes": (("h", "v"), drop_singles),
+        "singles": (("2",), drop_dominoes),
+        "exact": (("h", "v", "2"), same),
+    }
+    HEURISTICS = ("dominoes", "singles")
+
+    # filename -> open table, so a process maps each table once.
+    loaded = {}
+
+    def __init__(self, pattern, filename):
+        """
+        Use PatternDatabase.load to share tables within a process.
+
+        :param pattern: One of PatternDatabase.PATTERNS.
+        :type pattern: str
+        :param filename: The table file written by PatternDatabase.build.
+        :type filename: str
+        """
+        self.pattern = pattern
+        self.abstract = self.PATTERNS[pattern][1]
+        with open(filename, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = self.HEADER.unpack_from(self.map)
+        if magic != self.MAGIC:
+            raise ValueError("{} is not a pattern database".format(filename))
+        view = memoryview(self.map)
+        start = self.HEADER.size
+        self.count = count
+        self.keys = view[start:start + 8 * count].cast("Q")
+        self.dist = view[start + 8 * count:start + 9 * count]
+
+    def __call__(self, key):
+        """
+        Return the abstract distance of the packed key to the goal.
+        """
+        abstract = self.abstract(key)
+        i = bisect_left(self.keys, abstract)
+        if i < self.count and self.keys[i] == abstract:
+            return self.dist[i]
+        return self.UNREACHABLE
+
+    @classmethod
+    def filename(cls, pattern, counts, directory):
+        """
+        Return the table file for pattern and the piece counts of a board.
+        """
+        kept = cls.PATTERNS[pattern][0]
+        name = "".join("{}{}".format(cls.LABELS[type], counts[type]) for type in kept)
+        return os.path.join(directory, "{}-{}.pdb".format(pattern, name))
+
+    @classmethod
+    def build(cls, pattern, counts, filename):
+        """
+        Breadth-first search back from every abstract goal board and save
+        the distances to filename.
+        """
+        kept = cls.PATTERNS[pattern][0]
+        dist = {}
+        frontier = []
+        for key in goal_keys([(type, counts[type]) for type in kept]):
+            dist[key] = 0
+            frontier.append(key)
+        for key in frontier:
+            d = dist[key] + 1
+            for _, _, _, new_key in key_successors(key):
+                if new_key not in dist:
+                    dist[new_key] = d
+                    frontier.append(new_key)
+        if frontier and dist[frontier[-1]] >= cls.UNREACHABLE:
+            raise ValueError("distances do not fit in a byte")
+        keys = sorted(dist)
+        # Written aside and renamed into place, so other processes never
+        # map a table that is only partly written. The temp file is named
+        # after this process and opened like any other file, so the table
+        # gets the usual umask permissions (mkstemp would make it 0600).
+        temp = "{}.{}.tmp".format(filename, os.getpid())
+        try:
+            with open(temp, "wb") as f:
+                f.write(cls.HEADER.pack(cls.MAGIC, len(keys)))
+                array("Q", keys).tofile(f)
+                f.write(bytes(dist[key] for key in keys))
+            os.replace(temp, filename)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    @classmethod
+    def load(cls, pattern, key, directory, rebuild=False):
+        """
+        Open the table for the piece counts of key, building it first if
+        it is not in directory yet (or if rebuild is set).
+        """
+        counts = key_counts(key)
+        filename = cls.filename(pattern, counts, directory)
+        if rebuild or not os.path.exists(filename):
+            os.makedirs(directory, exist_ok=True)
+            cls.build(pattern, counts, filename)
+            cls.loaded.pop(filename, None)
+        if filename not in cls.loaded:
+            cls.loaded[filename] = cls(pattern, filename)
+        return cls.loaded[filename]
+
+
+def pdb_heuristic(key, directory):
+    """
+    Return a heuristic on packed keys taking the max over every pattern
+    database for the piece counts of key.
+    """
+    tables = [PatternDatabase.load(pattern, key, directory) for pattern in PatternDatabase.HEURISTICS]
+    def heuristic(key):
+        return max(table(key) for table in tables)
+    return heuristic
+
+
+def solvable(key, directory):
+    """
+    Return whether the goal can be reached from the packed key. The exact
+    table for the piece counts of key (built on first use) holds every
+    board that can reach the goal, so this is one lookup.
+    """
+    return PatternDatabase.load("exact", key, directory)(key) != PatternDatabase.UNREACHABLE
+
+
+#====================================================================================
+# Visited sets
+#
+# Backends for the explored set of the searches that only test membership
+# (run_A_star, run_DFS, run_DFS_inplace), see VISITED. The integer backends
+# store packed keys, 64 bits each, instead of string reps.
+
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15    # 2 ** 64 / golden ratio
+U64 = (1 << 64) - 1
+
+
+class KeySet:
+    """
+    Set of packed keys in an open addressing hash table: an array('Q') of
+    slots probed linearly from a multiplicative hash of the key, doubled
+    once more than 3/4 full, so a key costs 11 to 22 bytes (a string rep
+    in a set costs over 70). Slot value 0 marks an empty slot, so the key 0
+    is kept in a flag.
+    """
+
+    def __init__(self, size=1 << 16):
+        self.bits = max(1, (size - 1).bit_length())
+        self.slots = array("Q", bytes(8 << self.bits))
+        self.count = 0
+        self.zero = False
+
+    def __len__(self):
+        return self.count
+
+    def find(self, key):
+        """
+        Return the slot holding key, or the empty slot where it would go.
+        """
+        slots = self.slots
+        mask = len(slots) - 1
+        i = ((key * HASH_MULTIPLIER) & U64) >> (64 - self.bits)
+        while True:
+            found = slots[i]
+            if found == key or found == 0:
+                return i
+            i = (i + 1) & mask
+
+    def __contains__(self, key):
+        if key == 0:
+            return self.zero
+        return self.slots[self.find(key)] == key
+
+    def add(self, key):
+        if key == 0:
+            self.count += not self.zero
+            self.zero = True
+            return
+        i = self.find(key)
+        if self.slots[i] == key:
+            return
+        self.slots[i] = key
+        self.count += 1
+        if 4 * self.count > 3 * len(self.slots):
+            self.grow()
+
+    def grow(self):
+        """
+        Double the table and reinsert every key.
+        """
+        old = self.slots
+        self.bits += 1
+        self.slots = array("Q", bytes(8 << self.bits))
+        for key in old:
+            if key:
+                self.slots[self.find(key)] = key
+
+
+class BloomFilter:
+    """
+    Approximate set of packed keys, for DFS pruning in little memory: a key
+    that was added is always found, but one that was not is also found with
+    probability below about error. Grown in stages like a scalable Bloom
+    filter: once a stage holds its capacity, a new stage four times as large
+    with half the error takes the adds, so memory follows the keys actually
+    seen (about 1.8 bytes each at the default error) and the errors of the
+    stages sum to at most error. A key is found if any stage has all its bits.
+    """
+
+    def __init__(self, capacity=1 << 16, error=0.001):
+        self.capacity = capacity
+        self.error = error / 2
+        self.stages = []
+        self.count = 0
+        self.grow()
+
+    def __len__(self):
+        return self.count
+
+    def grow(self):
+        """
+        Start a new stage for the next capacity keys, at the next error.
+        """
+        if self.stages:
+            self.capacity *= 4
+            self.error /= 2
+        size = max(64, int(-self.capacity * math.log(self.error) / math.log(2) ** 2))
+        hashes = max(1, round(size / self.capacity * math.log(2)))
+        self.stages.append((size, hashes, bytearray((size + 7) // 8)))
+        self.filled = 0
+
+    @staticmethod
+    def positions(key, size, hashes):
+        """
+        The bit positions of key in a stage of size bits, by double hashing.
+        """
+        first = (key * HASH_MULTIPLIER) & U64
+        second = (((key ^ (key >> 31)) * 0xBF58476D1CE4E5B9) & U64) | 1
+        return [(first + i * second) % size for i in range(hashes)]
+
+    def __contains__(self, key):
+        for size, hashes, bits in self.stages:
+            for p in self.positions(key, size, hashes):
+                if not bits[p >> 3] >> (p & 7) & 1:
+                    break
+            else:
+                return True
+        return False
+
+    def add(self, key):
+        if self.filled >= self.capacity:
+            self.grow()
+        size, hashes, bits = self.stages[-1]
+        new = False
+        for p in self.positions(key, size, hashes):
+            if not bits[p >> 3] >> (p & 7) & 1:
+                bits[p >> 3] |= 1 << (p & 7)
+                new = True
+        self.filled += new
+        self.count += new
+
+
+# Explored set backends by --visited name. Only dfs may use bloom.
+VISITED = {"set": set, "table": KeySet, "bloom": BloomFilter}
+
+
+#====================================================================================
+# External memory breadth first search
+#
+# Every BFS layer is a file of sorted packed keys (native uint64), read back
+# through a memory map, so layers live on disk instead of in RAM. Successors
+# are collected in runs of bounded size, each sorted and written out, and the
+# runs are merged into the next layer with duplicates dropped as the sorted
+# streams pass by (delayed duplicate detection).
+
+class KeyFile:
+    """
+    A file of sorted packed keys, memory-mapped for reading.
+    """
+
+    BLOCK = 65536  # keys buffered per write
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.map = None
+        if os.path.getsize(filename) == 0:
+            # An empty file cannot be mapped.
+            self.keys = array("Q")
+        else:
+            with open(filename, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.keys = memoryview(self.map).cast("Q")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __contains__(self, key):
+        keys = self.keys
+        i = bisect_left(keys, key)
+        return i < len(keys) and keys[i] == key
+
+    def close(self):
+        if self.map is not None:
+            self.keys.release()
+            self.map.close()
+            self.map = None
+
+    @classmethod
+    def write(cls, filename, keys):
+        """
+        Write the sorted iterable keys to filename and return it opened.
+        """
+        buffer = array("Q")
+        with open(filename, "wb") as f:
+            for key in keys:
+                buffer.append(key)
+                if len(buffer) == cls.BLOCK:
+                    buffer.tofile(f)
+                    del buffer[:]
+            buffer.tofile(f)
+        return cls(filename)
+
+
+def merge_unique(runs):
+    """
+    Yield the keys of several sorted iterables in order, each once.
+    """
+    last = None
+    for key in merge(*runs):
+        if key != last:
+            yield key
+            last = key
+
+
+def key_difference(keys, exclude):
+    """
+    Yield the keys of the sorted iterable keys that are not in the sorted
+    iterable exclude, reading both once.
+    """
+    exclude = iter(exclude)
+    other = next(exclude, None)
+    for key in keys:
+        while other is not None and other < key:
+            other = next(exclude, None)
+        if other != key:
+            yield key
+
+
+#====================================================================================
+# Generalized puzzles
+#
+# A Puzzle takes its board size, piece shapes and exit from the input file
+# instead of the fixed tables above. Pieces of one shape are interchangeable,
+# so a position is packed as one origin mask (1 bit per cell) per shape,
+# shape s in bits [s * cells, (s + 1) * cells), the goal piece's shape first.
+# Every move of every shape is precomputed as cell masks and filed under the
+# lowest cell it fills, as in FILL_MOVES, so successors are found from the
+# blanks alone, however many pieces there are.
+
+STEP_DIRECTIONS = {(mx, my): dir for dir, (mx, my) in DIRECTIONS.items()}
+
+
+class Puzzle:
+    """
+    A sliding block puzzle of any size: its shapes and where they can move,
+    the exit of the goal piece, and the start position with the glyphs its
+    pieces are drawn with.
+    """
+
+    def __init__(self, width, height, shapes, exit, pieces, names=None):
+        """
+        :param width: The number of columns.
+        :type width: int
+        :param height: The number of rows.
+        :type height: int
+        :param shapes: The piece shapes, each a tuple of (dx, dy) cells from
+            the top left corner of its bounding box. shapes[0] is the shape
+            of the goal piece, and no other piece has it.
+        :type shapes: List[Tuple[Tuple[int, int], ...]]
+        :param exit: The (x, y) the top left corner of the goal piece must reach.
+        :type exit: Tuple[int, int]
+        :param pieces: The start position, as (shape index, x, y, face) for
+            every piece, face being the glyph of each cell of its shape.
+        :type pieces: List[Tuple[int, int, int, Tuple[str, ...]]]
+        :param names: The name of every shape in "moves" solutions, by
+            default the first glyph of the piece moved.
+        :type names: Optional[List[str]]
+        :raises ValueError: If the goal piece does not fit at the exit or
+            pieces overlap.
+        """
+        self.width = width
+        self.height = height
+        self.shapes = shapes
+        self.names = names
+        self.cells = cells = width * height
+        self.full = (1 << cells) - 1
+        # masks[s][origin] is the cell mask of shape s at origin.
+        self.masks = []
+        # fill_moves[c] lists the moves whose lowest filled cell is c, as
+        # (at, swap, filled, freed): the piece is there when key & at, and
+        # key ^ swap is the moved key.
+        self.fill_moves = [[] for c in range(cells)]
+        for s, shape in enumerate(shapes):
+            w = max(dx for dx, _ in shape) + 1
+            h = max(dy for _, dy in shape) + 1
+            masks = {}
+            for y in range(height - h + 1):
+                for x in range(width - w + 1):
+                    masks[y * width + x] = sum(1 << ((y + dy) * width + x + dx) for dx, dy in shape)
+            self.masks.append(masks)
+            shift = s * cells
+            for origin, old in masks.items():
+                x, y = origin % width, origin // width
+                for mx, my in DIRECTIONS.values():
+                    if not (0 <= x + mx <= width - w and 0 <= y + my <= height - h):
+                        continue
+                    new = masks[origin + my * width + mx]
+                    filled = new & ~old
+                    at = 1 << (origin + shift)
+                    swap = at | 1 << (origin + my * width + mx + shift)
+                    self.fill_moves[(filled & -filled).bit_length() - 1].append((at, swap, filled, old & ~new))
+        if exit[0] >= width or exit[1] * width + exit[0] not in self.masks[0]:
+            raise ValueError("malformed puzzle: the goal piece does not fit at the exit")
+        self.exit = exit
+        self.exit_bit = 1 << (exit[1] * width + exit[0])
+        self.start = 0
+        self.faces = {}
+        occupied = 0
+        for s, x, y, face in pieces:
+            mask = self.masks[s][y * width + x]
+            if mask & occupied:
+                raise ValueError("malformed puzzle: overlapping pieces")
+            occupied |= mask
+            self.start |= 1 << (y * width + x + s * cells)
+            self.faces[s, y * width + x] = face
+        self.start_blanks = self.full & ~occupied
+
+    @classmethod
+    def from_board(cls, board):
+        """
+        The Puzzle of a classic board (see Board), drawn with the same glyphs.
+        """
+        types = ("1", "h", "v", "2")
+        shapes = [tuple((dx, dy) for dx, dy, _ in SHAPES[type]) for type in types]
+        pieces = []
+        for piece in board.pieces:
+            type = board_type(piece)
+            pieces.append((types.index(type), piece.coord_x, piece.coord_y,
+                           tuple(ch for _, _, ch in SHAPES[type])))
+        return cls(WIDTH, HEIGHT, shapes, (GOAL_X, GOAL_Y), pieces, list(types))
+
+    def successors(self, key, blanks):
+        """
+        Yield (new key, new blanks) for every move from key, whose empty
+        cells are blanks.
+        """
+        fill_moves = self.fill_moves
+        b = blanks
+        while b:
+            low = b & -b
+            b ^= low
+            for at, swap, filled, freed in fill_moves[low.bit_length() - 1]:
+                if key & at and not filled & ~blanks:
+                    yield key ^ swap, blanks & ~filled | freed
+
+    def is_goal(self, key):
+        return key & self.exit_bit != 0
+
+    def manhattan(self, key):
+        """
+        The distance of the goal piece from the exit, in single cell moves.
+        """
+        origin = (key & self.full).bit_length() - 1
+        return abs(origin % self.width - self.exit[0]) + abs(origin // self.width - self.exit[1])
+
+    def solution_lines(self, keys, format="grids"):
+        """
+        Generate the text of a path of keys from the start, as solution_lines
+        does for packed keys. Pieces are followed from move to move to draw
+        them with their glyphs; "moves" names a piece by its shape name or
+        first glyph.
+        """
+        width = self.width
+        cells = self.cells
+        faces = dict(self.faces)
+        for i, key in enumerate(keys):
+            if i:
+                change = keys[i - 1] ^ key
+                s = ((change & -change).bit_length() - 1) // cells
+                old = (keys[i - 1] & change).bit_length() - 1 - s * cells
+                new = (key & change).bit_length() - 1 - s * cells
+                face = faces.pop((s, old))
+                faces[s, new] = face
+                if format == "moves":
+                    dir = STEP_DIRECTIONS[new % width - old % width, new // width - old // width]
+                    name = face[0] if self.names is None else self.names[s]
+                    yield "{} {} {} {}\n".format(name, old % width, old // width, dir)
+            if format == "grids":
+                grid = ["."] * cells
+                for (s, origin), face in faces.items():
+                    for (dx, dy), ch in zip(self.shapes[s], face):
+                        grid[origin + dy * width + dx] = ch
+                rep = "".join(grid)
+                yield "\n".join(rep[j:j + width] for j in range(0, cells, width)) + "\n\n"
+
+
+def parse_puzzle(lines):
+    """
+    Build a Puzzle from the lines of a variant input file: header lines
+    'name: value', then the rows of the board, every row as wide. A cell
+    is '.' when empty, and a piece is every cell of one glyph connected
+    through its sides, so pieces that touch need different glyphs.
+    The headers are
+        goal: <the glyph of the goal piece>
+        exit: <x> <y>   (where the top left corner of the goal piece must go)
+
+    :param lines: The lines of the file.
+    :type lines: Iterable[str]
+    :rtype: Puzzle
+    :raises ValueError: If the puzzle is malformed.
+    """
+    header = {}
+    rows = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not rows and ":" in line:
+            name, _, value = line.partition(":")
+            header[name.strip()] = value.strip()
+        elif line.strip():
+            rows.append(line)
+    if "goal" not in header or "exit" not in header:
+        raise ValueError("malformed puzzle: goal and exit headers are required")
+    try:
+        exit = tuple(int(v) for v in header["exit"].split())
+    except ValueError:
+        exit = ()
+    if len(exit) != 2 or min(exit) < 0:
+        raise ValueError("malformed puzzle: exit must be two coordinates")
+    if not rows or any(len(row) != len(rows[0]) for row in rows):
+        raise ValueError("malformed puzzle: rows must all be as wide")
+    width, height = len(rows[0]), len(rows)
+    seen = set()
+    found = []
+    for y, row in enumerate(rows):
+        for x, ch in enumerate(row):
+            if ch == "." or (x, y) in seen:
+                continue
+            if ch.isspace() or ch == ":":
+                raise ValueError("malformed puzzle: unknown cell {!r}".format(ch))
+            cells = [(x, y)]
+            seen.add((x, y))
+            for cx, cy in cells:
+                for mx, my in DIRECTIONS.values():
+                    nx, ny = cx + mx, cy + my
+                    if 0 <= nx < width and 0 <= ny < height and rows[ny][nx] == ch and (nx, ny) not in seen:
+                        seen.add((nx, ny))
+                        cells.append((nx, ny))
+            found.append((ch, sorted(cells, key=lambda cell: (cell[1], cell[0]))))
+    goals = [cells for ch, cells in found if ch == header["goal"]]
+    if len(goals) != 1:
+        raise ValueError("malformed puzzle: expected one goal piece")
+    # Shape 0 is the goal piece's, the others are numbered as first seen.
+    shapes = [None]
+    index = {}
+    pieces = []
+    for ch, cells in found:
+        left = min(cx for cx, _ in cells)
+        top = min(cy for _, cy in cells)
+        shape = tuple((cx - left, cy - top) for cx, cy in cells)
+        if cells is goals[0]:
+            s = 0
+            shapes[0] = shape
+        else:
+            s = index.get(shape)
+            if s is None:
+                s = index[shape] = len(shapes)
+                shapes.append(shape)
+        pieces.append((s, left, top, (ch,) * len(cells)))
+    return Puzzle(width, height, shapes, exit, pieces)
+
+
+class BucketQueue:
+    """
+    Open list for A* keyed by small integer f values (a dial queue).
+
+    buckets[f][g] is a stack of the items pushed with that f and g, and
+    top[f] is the highest g with a non-empty stack. pop returns an item of
+    the lowest f, breaking ties toward the deepest g and then the latest
+    push, so the search order does not depend on object hashes or ids.
+    Push and pop are O(1) apart from the cursor moves over empty buckets.
+    """
+
+    def __init__(self):
+        self.buckets = []
+        self.top = []
+        self.min_f = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        """
+        Yield (f, g, item) for every queued item, lowest f first.
+        """
+        for f, bucket in enumerate(self.buckets):
+            for g in range(len(bucket) - 1, -1, -1):
+                for item in reversed(bucket[g]):
+                    yield f, g, item
+
+    def push(self, f, g, item):
+        buckets = self.buckets
+        while len(buckets) <= f:
+            buckets.append([])
+            self.top.append(-1)
+        bucket = buckets[f]
+        while len(bucket) <= g:
+            bucket.append([])
+        bucket[g].append(item)
+        if g > self.top[f]:
+            self.top[f] = g
+        if f < self.min_f:
+            self.min_f = f
+        self.size += 1
+
+    def pop(self):
+        """
+        Remove and return (f, g, item) with the lowest f and deepest g.
+        """
+        if not self.size:
+            raise IndexError("pop from an empty BucketQueue")
+        top = self.top
+        f = self.min_f
+        while top[f] < 0:
+            f += 1
+        self.min_f = f
+        g = top[f]
+        bucket = self.buckets[f]
+        item = bucket[g].pop()
+        rest = g
+        while rest >= 0 and not bucket[rest]:
+            rest -= 1
+        top[f] = rest
+        self.size -= 1
+        return f, g, item
+
+
+class Solvers:
+    def __init__(self, startState, endState=None, symmetry=False, heuristic=None,
+                 timing=False, progress=None, progress_every=10000, output_format="grids", visited="set"):
+        self.startState = startState
+        self.endState = endState
+        self.currentState = startState
+        self.frontierList = []       # contains state
+        self.visited = visited         # explored set backend, see VISITED
+        self.exploredSet = VISITED[visited]()       # for pruning
+        self.best_g = {}               # A*: lowest depth queued per unexpanded string rep
+        self.step = 0               # nodes expanded
+        self.frontier_peak = 0      # largest frontier size seen
+        self.generated = 0          # successors generated
+        self.duplicates = 0         # successors dropped as already explored
+        self.solution = None      # path of packed keys once solved
+        self.depth = None
+        self.elapsed = None
+        self.bound = None         # anytime search and deepening: solution cost / optimal cost is at most this
+        self.reached = None       # boards reached by the last depth limited DFS
+        # Seconds spent per phase when timing is on (see timed), else None.
+        self.timing = {"movegen": 0.0, "dedup": 0.0, "frontier": 0.0} if timing else None
+        # progress(stats dict) is called every progress_every expansions.
+        self.progress = progress
+        self.progress_every = progress_every
+        self.output_format = output_format    # see solution_lines
+        # Map string reps / packed keys to the form used in the explored set.
+        # With symmetry a board and its left-right mirror share one entry.
+        self.symmetry = symmetry
+        if symmetry:
+            self.rep_of = canonical_rep
+            self.key_of = canonical_key
+        else:
+            self.rep_of = self.key_of = same
+        if visited != "set":
+            # The integer backends hold packed keys instead of string reps.
+            key_of = self.key_of
+            self.rep_of = lambda rep: key_of(rep_key(rep))
+        # Heuristic on packed keys for A*; None means Board.manhattan.
+        self.heuristic = heuristic
+
+    def timed(self, phase, func, materialize=False):
+        """
+        Return func, or when timing is on a wrapper adding its run time to
+        self.timing[phase]. Generators are only timed when materialize is
+        set, in which case the wrapper returns a list.
+        The search loops call these aliases, so timing costs nothing when off.
+        """
+        if self.timing is None:
+            return func
+        timing = self.timing
+        clock = time.perf_counter
+        def wrapper(*args):
+            start = clock()
+            result = func(*args)
+            if materialize:
+                result = list(result)
+            timing[phase] += clock() - start
+            return result
+        return wrapper
+
+    def stats(self):
+        """
+        Return the search counters as a dict (see --stats).
+        """
+        return {
+            "expanded": self.step,
+            "generated": self.generated,
+            "duplicates": self.duplicates,
+            "frontier_peak": self.frontier_peak,
+            "depth": self.depth,
+            "bound": self.bound,
+            "elapsed": self.elapsed,
+            "time": dict(self.timing) if self.timing is not None else None,
+        }
+
+    def estimate(self, board):
+        """
+        Heuristic value of board for A*.
+        """
+        if self.heuristic is None:
+            return board.manhattan()
+        return self.heuristic(board.getKey())
+
+    def checkGoal(self) -> bool:
+        """
+        Check whether currentState is the goal """
+        board = self.currentState.board
+        grid = board.grid
+        if (grid[3][1] == "1" and
+            grid[4][1] == "1" and
+            grid[3][2] == "1" and
+            grid[4][2] == "1"):
+            return True
+        return False
+
+    def add_successor(self, i, type ,dir, algo):
+        """
+        Deep copy the current state, move the newState, and add it to the frontier
+        """
+        timing = self.timing
+        if timing is not None:
+            clock = time.perf_counter
+            start = clock()
+        newBoard = deepcopy(self.currentState.board)
+        newBoard = newBoard.move(newBoard.pieces, i, type, dir)
+        if timing is not None:
+            now = clock()
+            timing["movegen"] += now - start
+            start = now
+        new_str = self.rep_of(newBoard.getStringRep())
+        depth = self.currentState.depth + 1
+        self.generated += 1
+        if new_str in self.exploredSet or (algo == "A*" and self.best_g.get(new_str, depth + 1) <= depth):
+            self.duplicates += 1
+            if timing is not None:
+                timing["dedup"] += clock() - start
+            return
+        if timing is not None:
+            now = clock()
+            timing["dedup"] += now - start
+            start = now
+        f = self.estimate(newBoard) + depth
+        self.best_g[new_str] = depth
+        self.frontierList.push(f, depth, State(newBoard, f, depth, self.currentState))
+        if timing is not None:
+            timing["frontier"] += clock() - start
+
+
+    
+    def move_near(self, algo) -> None:
+        """
+        Search all possible ways to move the pieces, and move them,
+        Add the state into the frontier.
+        algo == "A*" (DFS makes its successors lazily, see board_successors)
+        """
+        if self.timing is not None:
+            start = time.perf_counter()
+            moves = self.currentState.board.legal_moves()
+            self.timing["movegen"] += time.perf_counter() - start
+        else:
+            moves = self.currentState.board.legal_moves()
+        for i, type, dir in moves:
+            self.add_successor(i, type, dir, algo)
+
+
+
+    def run_A_star(self, outputfile):
+        """
+        A* algorithm with Manhattan heuristics to find the optimal solution.
+        frontierList is a BucketQueue of states keyed by
+        (f = depth + heuristic value, depth).
+
+        Tie-breaking rule:
+        Among states of equal f the deepest one is expanded first, then the
+        latest pushed, so runs are reproducible.
+        best_g keeps the lowest depth queued for each board, so a duplicate
+        that is not shallower is never pushed, and a queued entry that was
+        beaten by a later, shallower one is skipped when popped. A board
+        leaves best_g once expanded, as exploredSet then rules it out.
+        
+        """
+        self.frontierList = BucketQueue()
+        # Update current state's heuristic value
+        self.currentState.f = self.estimate(self.currentState.board)
+        # Push (f, state) into the frontier
+        self.best_g[self.rep_of(self.currentState.board.getStringRep())] = 0
+        self.frontierList.push(self.currentState.f, 0, self.currentState)
+        while self.frontierList:
+            # Pop the lowest f (then deepest) state out of the frontier
+            _, _, curState = self.frontierList.pop()
+            # Get string representation of the current state
+            cur_str = self.rep_of(curState.board.getStringRep())
+            # Update current state for later function calls
+            self.currentState = curState
+            if cur_str not in self.exploredSet and curState.depth == self.best_g[cur_str]:
+                # Add current state to the explored set
+                self.exploredSet.add(cur_str)
+                del self.best_g[cur_str]
+                # Check if current state is the goal state
+                if self.checkGoal():    
+                    # Output to file        
+                    self.write_solution([state.board.getKey() for state in self.currentState.trace_path()], outputfile)
+                    return self.currentState.depth
+                # Find successors and add them to frontier
+                self.step += 1
+                self.move_near("A*")
+                if len(self.frontierList) > self.frontier_peak:
+                    self.frontier_peak = len(self.frontierList)
+                if self.progress is not None and self.step % self.progress_every == 0:
+                    self.progress(self.stats())
+            else:
+                self.duplicates += 1
+
+
+    def board_successors(self, state):
+        """
+        Yield the successors of state one at a time, each a State on a
+        moved deep copy of its board, so that only the successor being
+        searched exists.
+        """
+        timing = self.timing
+        clock = time.perf_counter
+        board = state.board
+        for i, type, dir in board.legal_moves():
+            if timing is not None:
+                start = clock()
+            new_board = deepcopy(board)
+            new_board.move(new_board.pieces, i, type, dir)
+            if timing is not None:
+                timing["movegen"] += clock() - start
+            yield State(new_board, 0, state.depth + 1, state)
+
+    def dfs_visited(self, depth_limit, explored):
+        """
+        Return (seen, fresh) for a DFS, where fresh(canon, depth) records
+        canon reached at depth and tells whether to search it.
+        Without a depth limit seen is explored and every board is searched
+        once. With one, seen is a dict of the lowest depth each board was
+        reached at and a board reached again shallower is searched again,
+        so every board within the limit is reached at its lowest depth and
+        a solution within the limit is always found.
+        """
+        if depth_limit is None:
+            seen = explored
+            def fresh(canon, depth):
+                if canon in seen:
+                    return False
+                seen.add(canon)
+                return True
+        else:
+            seen = {}
+            def fresh(canon, depth):
+                if seen.get(canon, depth + 1) <= depth:
+                    return False
+                seen[canon] = depth
+                return True
+        return seen, self.timed("dedup", fresh)
+
+    def run_DFS(self, outputfile, depth_limit=None):
+        """
+        DFS on a stack of lazy successor generators (see board_successors):
+        a level of the stack makes its next successor only once the search
+        below the previous one is over, so the frontier holds one board per
+        depth instead of every successor not searched yet.
+        Successors are checked against the explored set as they are made;
+        with depth_limit, boards at that depth are not expanded (see
+        dfs_visited and run_deepening).
+        Returns the depth of the solution, or None, printing NOT found!
+        only when there is no limit.
+        """
+        seen, fresh = self.dfs_visited(depth_limit, self.exploredSet)
+        start = self.currentState
+        fresh(self.rep_of(start.board.getStringRep()), 0)
+        if self.checkGoal():
+            self.write_solution([start.board.getKey()], outputfile)
+            return 0
+        frontier = []
+        if depth_limit is None or depth_limit > 0:
+            frontier.append(self.board_successors(start))
+        while frontier:
+            state = next(frontier[-1], None)
+            if state is None:
+                frontier.pop(-1)
+                continue
+            self.generated += 1
+            if not fresh(self.rep_of(state.board.getStringRep()), state.depth):
+                self.duplicates += 1
+                continue
+            # Update current state for checkGoal
+            self.currentState = state
+            if self.checkGoal():
+                self.write_solution([state.board.getKey() for state in state.trace_path()], outputfile)
+                return state.depth
+            if depth_limit is not None and state.depth >= depth_limit:
+                continue
+            self.step += 1
+            frontier.append(self.board_successors(state))
+            if len(frontier) > self.frontier_peak:
+                self.frontier_peak = len(frontier)
+            if self.progress is not None and self.step % self.progress_every == 0:
+                self.progress(self.stats())
+        if depth_limit is not None:
+            self.reached = len(seen)
+            return None
+        print("NOT found!")
+
+    def run_A_star_packed(self, outputfile):
+        """
+        A* over packed keys (see key_successors). The frontier is a
+        BucketQueue of (key, parent key) items and the explored set is a dict
+        from key to parent key, so no Board or State is created per node.
+        best maps every queued but unexpanded key to its lowest g, so worse
+        duplicates are never queued (see run_A_star).
+        Returns the depth of the solution.
+        """
+        key_of = self.key_of
+        h = self.heuristic or key_manhattan
+        successors = self.timed("movegen", key_successors, materialize=True)
+        frontier = BucketQueue()
+        push = self.timed("frontier", frontier.push)
+        pop = self.timed("frontier", frontier.pop)
+        progress = self.progress
+        start = self.currentState.board.getKey()
+        explored = {}
+        best = {key_of(start): 0}
+        def fresh(key, g):
+            canon = key_of(key)
+            if canon in explored or best.get(canon, g + 1) <= g:
+                return False
+            best[canon] = g
+            return True
+        fresh = self.timed("dedup", fresh)
+        push(h(start), 0, (start, None))
+        while frontier:
+            _, g, (key, parent) = pop()
+            canon = key_of(key)
+            if canon in explored or best[canon] != g:
+                self.duplicates += 1
+                continue
+            del best[canon]
+            explored[canon] = parent
+            if key_is_goal(key):
+                self.write_solution(self.trace_keys(explored, key), outputfile)
+                return g
+            self.step += 1
+            for _, _, _, new_key in successors(key):
+                self.generated += 1
+                if fresh(new_key, g + 1):
+                    push(g + 1 + h(new_key), g + 1, (new_key, key))
+                else:
+                    self.duplicates += 1
+            if len(frontier) > self.frontier_peak:
+                self.frontier_peak = len(frontier)
+            if progress is not None and self.step % self.progress_every == 0:
+                progress(self.stats())
+
+    def run_DFS_packed(self, outputfile, depth_limit=None):
+        """
+        DFS over packed keys on a stack of key_successors generators, with
+        the depth limit of run_DFS. path holds the keys from the start to
+        the board being searched, one per generator on the stack.
+        Returns the depth of the solution.
+        """
+        key_of = self.key_of
+        successors = self.timed("movegen", key_successors, materialize=True)
+        progress = self.progress
+        start = self.currentState.board.getKey()
+        seen, fresh = self.dfs_visited(depth_limit, set())
+        fresh(key_of(start), 0)
+        path = [start]
+        if key_is_goal(start):
+            self.write_solution(path, outputfile)
+            return 0
+        frontier = []
+        if depth_limit is None or depth_limit > 0:
+            frontier.append(iter(successors(start)))
+        push = self.timed("frontier", frontier.append)
+        while frontier:
+            step = next(frontier[-1], None)
+            if step is None:
+                frontier.pop(-1)
+                path.pop(-1)
+                continue
+            new_key = step[3]
+            depth = len(path)
+            self.generated += 1
+            if not fresh(key_of(new_key), depth):
+                self.duplicates += 1
+                continue
+            path.append(new_key)
+            if key_is_goal(new_key):
+                self.write_solution(path, outputfile)
+                return depth
+            if depth_limit is not None and depth >= depth_limit:
+                path.pop(-1)
+                continue
+            self.step += 1
+            push(iter(successors(new_key)))
+            if len(frontier) > self.frontier_peak:
+                self.frontier_peak = len(frontier)
+            if progress is not None and self.step % self.progress_every == 0:
+                progress(self.stats())
+        if depth_limit is not None:
+            self.reached = len(seen)
+            return None
+        print("NOT found!")
+
+    def run_A_star_inplace(self, outputfile):
+        """
+        A* that keeps a single working board. A popped key is loaded into
+        the board, and every successor is made with Board.move, keyed, and
+        taken back with Board.undo. The frontier (a BucketQueue, with best g
+        tracking as in run_A_star_packed) holds keys, and the explored dict
+        maps each key to its (parent key, move) record, where a move is
+        (x, y, dir) of the moved piece's top left corner. The path is rebuilt
+        by replaying the move log from the start board.
+        Returns the depth of the solution.
+        """
+        key_of = self.key_of
+        board = self.currentState.board
+        legal_moves = self.timed("movegen", Board.legal_moves)
+        frontier = BucketQueue()
+        push = self.timed("frontier", frontier.push)
+        pop = self.timed("frontier", frontier.pop)
+        progress = self.progress
+        start = board.getKey()
+        explored = {}
+        best = {key_of(start): 0}
+        def fresh(key, g):
+            canon = key_of(key)
+            if canon in explored or best.get(canon, g + 1) <= g:
+                return False
+            best[canon] = g
+            return True
+        fresh = self.timed("dedup", fresh)
+        push(self.estimate(board), 0, (start, None, None))
+        while frontier:
+            _, g, (key, parent, last) = pop()
+            canon = key_of(key)
+            if canon in explored or best[canon] != g:
+                self.duplicates += 1
+                continue
+            del best[canon]
+            explored[canon] = (parent, last)
+            if key_is_goal(key):
+                self.replay_to_file(start, self.trace_moves(explored, key), outputfile)
+                return g
+            self.step += 1
+            board.load_key(key)
+            pieces = board.pieces
+            for i, type, dir in legal_moves(board):
+                piece = pieces[i]
+                move = (piece.coord_x, piece.coord_y, dir)
+                board.move(pieces, i, type, dir)
+                new_key = board.getKey()
+                self.generated += 1
+                if fresh(new_key, g + 1):
+                    push(g + 1 + self.estimate(board), g + 1, (new_key, key, move))
+                else:
+                    self.duplicates += 1
+                board.undo(pieces, i, type, dir)
+            if len(frontier) > self.frontier_peak:
+                self.frontier_peak = len(frontier)
+            if progress is not None and self.step % self.progress_every == 0:
+                progress(self.stats())
+
+    def run_DFS_inplace(self, outputfile, depth_limit=None):
+        """
+        DFS that walks a single working board with Board.move/Board.undo.
+        The frontier is a stack of per-depth move iterators and the move log
+        is the current path, so only explored keys are stored per node.
+        depth_limit is as in run_DFS.
+        Returns the depth of the solution.
+        """
+        key_of = self.key_of
+        board = self.currentState.board
+        pieces = board.pieces
+        legal_moves = self.timed("movegen", Board.legal_moves)
+        start = board.getKey()
+        seen, fresh = self.dfs_visited(depth_limit, VISITED[self.visited]())
+        fresh(key_of(start), 0)
+        log = []
+        if key_is_goal(start):
+            self.replay_to_file(start, log, outputfile)
+            return 0
+        frontier = []
+        if depth_limit is None or depth_limit > 0:
+            frontier.append(iter(legal_moves(board)))
+        while frontier:
+            step = next(frontier[-1], None)
+            if step is None:
+                frontier.pop(-1)
+                if log:
+                    board.undo(pieces, *log.pop(-1)[0])
+                continue
+            piece = pieces[step[0]]
+            move = (piece.coord_x, piece.coord_y, step[2])
+            board.move(pieces, *step)
+            key = board.getKey()
+            self.generated += 1
+            if not fresh(key_of(key), len(log) + 1):
+                self.duplicates += 1
+                board.undo(pieces, *step)
+                continue
+            log.append((step, move))
+            if key_is_goal(key):
+                self.replay_to_file(start, [move for _, move in log], outputfile)
+                return len(log)
+            if depth_limit is not None and len(log) >= depth_limit:
+                board.undo(pieces, *log.pop(-1)[0])
+                continue
+            self.step += 1
+            frontier.append(iter(legal_moves(board)))
+            if len(frontier) > self.frontier_peak:
+                self.frontier_peak = len(frontier)
+            if self.progress is not None and self.step % self.progress_every == 0:
+                self.progress(self.stats())
+        if depth_limit is not None:
+            self.reached = len(seen)
+            return None
+        print("NOT found!")
+
+    def run_deepening(self, dfs, outputfile, depth_limit=None):
+        """
+        Iterative deepening: dfs (one of the run_DFS methods) with a depth
+        limit starting at the heuristic value of the start board and rising
+        by one, until a solution is found, which is then at the optimal
+        depth. A round reaching no more boards than the previous one has
+        searched every reachable board. Counters add up over the rounds.
+        Returns the depth of the solution.
+        """
+        start = self.currentState
+        limit = self.estimate(start.board)
+        reached = None
+        while depth_limit is None or limit <= depth_limit:
+            self.currentState = start
+            depth = dfs(outputfile, limit)
+            if depth is not None:
+                self.bound = 1
+                return depth
+            if self.reached == reached:
+                print("NOT found!")
+                return None
+            reached = self.reached
+            limit += 1
+        print("No solution within {} moves".format(depth_limit))
+
+    def run_IDA_star(self, outputfile, table_size=100000):
+        """
+        IDA*: rounds of depth first search on a single working board
+        (Board.move/Board.undo), each cut off where depth + heuristic value
+        goes over a bound, which rises after every round that fails, so the
+        first goal reached is at the optimal depth.
+
+        Memory is the current path plus a transposition table of at most
+        table_size keys (the least recently stored is dropped when full).
+        It maps each key to (round, depth, h): a key reached again in the
+        same round no shallower is skipped, and h is a lower bound on its
+        distance to the goal, raised to the best value backed up from its
+        children after a failed search below it. Each round starts from the
+        bounds learned in the previous ones, so it does not redo their work.
+        A round that fails without cutting off any board has searched every
+        reachable board, so the goal cannot be reached.
+        Returns the depth of the solution.
+        """
+        key_of = self.key_of
+        board = self.currentState.board
+        pieces = board.pieces
+        legal_moves = self.timed("movegen", Board.legal_moves)
+        heuristic = self.heuristic
+        progress = self.progress
+        path = [board.getKey()]
+        on_path = {key_of(path[0])}
+        table = {}
+        lookup = self.timed("dedup", table.get)
+        def remember(canon, g, h):
+            if table.pop(canon, None) is None and len(table) >= table_size and table:
+                del table[next(iter(table))]
+            table[canon] = (rounds, g, h)
+        remember = self.timed("dedup", remember)
+        def estimate(key):
+            return board.manhattan() if heuristic is None else heuristic(key)
+
+        def bounded(g, bound):
+            # True once the goal is at the end of path, else a lower bound
+            # on the cost of a solution through it.
+            nonlocal cut
+            if key_is_goal(path[-1]):
+                return True
+            self.step += 1
+            if progress is not None and self.step % self.progress_every == 0:
+                progress(self.stats())
+            lowest = float("inf")
+            for i, type, dir in legal_moves(board):
+                board.move(pieces, i, type, dir)
+                new_key = board.getKey()
+                canon = key_of(new_key)
+                self.generated += 1
+                entry = lookup(canon)
+                h = estimate(new_key) if entry is None else entry[2]
+                f = g + 1 + h
+                if canon in on_path or (entry is not None and entry[0] == rounds and entry[1] <= g + 1):
+                    self.duplicates += 1
+                elif f > bound:
+                    cut = True
+                    remember(canon, g + 1, h)
+                else:
+                    remember(canon, g + 1, h)
+                    path.append(new_key)
+                    on_path.add(canon)
+                    if len(path) > self.frontier_peak:
+                        self.frontier_peak = len(path)
+                    f = bounded(g + 1, bound)
+                    if f is True:
+                        return True
+                    path.pop(-1)
+                    on_path.discard(canon)
+                    remember(canon, g + 1, max(h, f - g - 1))
+                lowest = min(lowest, f)
+                board.undo(pieces, i, type, dir)
+            return lowest
+
+        rounds = 0
+        bound = estimate(path[0])
+        while True:
+            cut = False
+            found = bounded(0, bound)
+            if found is True:
+                self.write_solution(path, outputfile)
+                return len(path) - 1
+            if not cut:
+                print("NOT found!")
+                return None
+            # Both are lower bounds on the solution depth once a round fails.
+            bound = max(found, bound + 1)
+            rounds += 1
+
+    def run_table(self, outputfile, table):
+        """
+        Solve with an exact distance table (PatternDatabase "exact"):
+        from the start, step to any successor one move closer to the goal.
+        Returns the depth of the solution.
+        """
+        key = self.currentState.board.getKey()
+        d = table(key)
+        if d == table.UNREACHABLE:
+            print("NOT found!")
+            return None
+        path = [key]
+        while d:
+            d -= 1
+            self.step += 1
+            for _, _, _, new_key in key_successors(key):
+                if table(new_key) == d:
+                    key = new_key
+                    break
+            path.append(key)
+        self.write_solution(path, outputfile)
+        return len(path) - 1
+
+    def run_bidirectional(self, outputfile):
+        """
+        Breadth first search over packed keys from the start and, backwards,
+        from every goal board with the same pieces (see goal_keys). Moves
+        are reversible, so both sides use key_successors, and each keeps a
+        parent map as in run_A_star_packed. Every step expands a whole layer
+        of the side with the smaller frontier; after the first layer that
+        reaches keys seen by the other side, the shortest path through one
+        of them is optimal, and is spliced from the two parent maps.
+        Returns the depth of the solution.
+        """
+        key_of = self.key_of
+        successors = self.timed("movegen", key_successors, materialize=True)
+        progress = self.progress
+        start = self.currentState.board.getKey()
+        forward = {key_of(start): None}
+        backward = {}
+        goals = []
+        counts = key_counts(start)
+        for goal in goal_keys([(type, counts[type]) for type in ("h", "v", "2")]):
+            if key_of(goal) not in backward:
+                backward[key_of(goal)] = None
+                goals.append(goal)
+        if key_of(start) in backward:
+            self.write_solution([start], outputfile)
+            return 0
+
+        def stored(parents, key):
+            # The key actually stored for key's entry: key, or with symmetry
+            # possibly its mirror.
+            parent = parents[key_of(key)]
+            if parent is None:
+                found = key == start if parents is forward else key_is_goal(key)
+            else:
+                found = any(new_key == key for _, _, _, new_key in key_successors(parent))
+            return key if found else mirror_key(key)
+
+        def splice(ahead, behind):
+            # ahead is stored in forward and behind, the same board or its
+            # mirror, in backward.
+            path = self.trace_keys(forward, ahead)
+            rest = self.trace_keys(backward, behind)[::-1]
+            if ahead != behind:
+                rest = [mirror_key(key) for key in rest]
+            return path + rest[1:]
+
+        frontiers = {True: [start], False: goals}
+        while frontiers[True] and frontiers[False]:
+            ahead = len(frontiers[True]) <= len(frontiers[False])
+            seen, other = (forward, backward) if ahead else (backward, forward)
+            layer = []
+            meetings = []
+            for key in frontiers[ahead]:
+                self.step += 1
+                for _, _, _, new_key in successors(key):
+                    self.generated += 1
+                    canon = key_of(new_key)
+                    if canon in seen:
+                        self.duplicates += 1
+                        continue
+                    seen[canon] = key
+                    layer.append(new_key)
+                    if canon in other:
+                        meetings.append(new_key)
+                if progress is not None and self.step % self.progress_every == 0:
+                    progress(self.stats())
+            frontiers[ahead] = layer
+            self.frontier_peak = max(self.frontier_peak, len(frontiers[True]) + len(frontiers[False]))
+            if meetings:
+                paths = []
+                for key in meetings:
+                    if ahead:
+                        paths.append(splice(key, stored(backward, key)))
+                    else:
+                        paths.append(splice(stored(forward, key), key))
+                path = min(paths, key=len)
+                self.write_solution(path, outputfile)
+                return len(path) - 1
+        print("NOT found!")
+        return None
+
+    def run_BFS_layers(self, outputfile):
+        """
+        Breadth first search a layer at a time over sorted numpy arrays of
+        packed keys (see layer_successors). Moves are reversible, so the
+        successors of layer d only need to be taken out of layers d - 1 and
+        d to leave layer d + 1, and only these two are compared against.
+        All layers are kept to walk a path back from the first goal found:
+        from each key, a successor in the layer before.
+        Returns the depth of the solution.
+        """
+        if numpy is None:
+            raise RuntimeError("the layered BFS needs numpy")
+        key_of = self.key_of
+        canonical = canonical_layer if self.symmetry else same
+        successors = self.timed("movegen", layer_successors)
+        def fresh(found, layer, previous):
+            found = numpy.setdiff1d(numpy.unique(canonical(found)), layer, assume_unique=True)
+            return numpy.setdiff1d(found, previous, assume_unique=True)
+        fresh = self.timed("dedup", fresh)
+        progress = self.progress
+        start = self.currentState.board.getKey()
+        layers = [numpy.array([key_of(start)], dtype=numpy.uint64)]
+        previous = numpy.zeros(0, dtype=numpy.uint64)
+        while len(layers[-1]):
+            layer = layers[-1]
+            goals = numpy.flatnonzero((layer & numpy.uint64(GOAL_FIELD)) == numpy.uint64(GOAL_VALUE))
+            if len(goals):
+                path = self.trace_layers(layers, int(layer[goals[0]]))
+                if path[0] != start:
+                    path = [mirror_key(key) for key in path]
+                self.write_solution(path, outputfile)
+                return len(path) - 1
+            before = self.step
+            self.step += len(layer)
+            found = successors(layer)
+            self.generated += len(found)
+            layers.append(fresh(found, layer, previous))
+            self.duplicates += len(found) - len(layers[-1])
+            previous = layer
+            self.frontier_peak = max(self.frontier_peak, len(layers[-1]))
+            if progress is not None and self.step // self.progress_every > before // self.progress_every:
+                progress(self.stats())
+        print("NOT found!")
+        return None
+
+    def trace_layers(self, layers, key, contains=None):
+        """
+        Walk back from key, in the last of the sorted BFS layers, to the
+        start, stepping each time to a successor found in the layer before.
+        contains(layer, key) tells whether key is in a layer; by default
+        layers are numpy arrays.
+        Returns the path from the start (or, with symmetry, possibly from
+        its mirror image).
+        """
+        if contains is None:
+            def contains(layer, key):
+                at = numpy.searchsorted(layer, key)
+                return at < len(layer) and layer[at] == key
+        path = [key]
+        for layer in reversed(layers[:-1]):
+            for _, _, _, new_key in key_successors(key):
+                if contains(layer, self.key_of(new_key)):
+                    key = new_key
+                    break
+            path.append(key)
+        return path[::-1]
+
+    def run_BFS_external(self, outputfile, workdir=None, run_size=1 << 20):
+        """
+        Breadth first search with its layers on disk (see KeyFile), for
+        state spaces larger than memory. A layer is read through its memory
+        map and the successors of its keys are gathered in a set, written
+        out sorted as a run each time it reaches run_size keys. The runs
+        are then merged into the next layer, leaving out the keys of this
+        layer and the one before as in run_BFS_layers.
+        Memory is the run set and a buffer per open file, however many
+        boards there are. Layers are kept, in a temporary directory under
+        workdir that is removed at the end, to walk back from the goal.
+        Returns the depth of the solution.
+        """
+        key_of = self.key_of
+        successors = self.timed("movegen", key_successors, materialize=True)
+        progress = self.progress
+        start = self.currentState.board.getKey()
+        directory = tempfile.mkdtemp(prefix="hrd-bfs-", dir=workdir)
+        layers = []
+        runs = []
+        def flush(found):
+            name = os.path.join(directory, "run-{}".format(len(runs)))
+            runs.append(KeyFile.write(name, sorted(found)))
+            found.clear()
+        flush = self.timed("frontier", flush)
+        def next_layer(layer, previous):
+            name = os.path.join(directory, "layer-{}".format(len(layers)))
+            new = KeyFile.write(name, key_difference(key_difference(merge_unique(runs), layer), previous))
+            for run in runs:
+                run.close()
+                os.remove(run.filename)
+            del runs[:]
+            return new
+        next_layer = self.timed("dedup", next_layer)
+        try:
+            layers.append(KeyFile.write(os.path.join(directory, "layer-0"), [key_of(start)]))
+            previous = ()
+            while len(layers[-1]):
+                layer = layers[-1]
+                before = self.step
+                generated = self.generated
+                found = set()
+                for key in layer:
+                    if key_is_goal(key):
+                        path = self.trace_layers(layers, key, KeyFile.__contains__)
+                        if path[0] != start:
+                            path = [mirror_key(key) for key in path]
+                        self.write_solution(path, outputfile)
+                        return len(path) - 1
+                    self.step += 1
+                    for _, _, _, new_key in successors(key):
+                        self.generated += 1
+                        found.add(key_of(new_key))
+                    if len(found) >= run_size:
+                        flush(found)
+                if found:
+                    flush(found)
+                layers.append(next_layer(layer, previous))
+                self.duplicates += self.generated - generated - len(layers[-1])
+                previous = layer
+                self.frontier_peak = max(self.frontier_peak, len(layers[-1]))
+                if progress is not None and self.step // self.progress_every > before // self.progress_every:
+                    progress(self.stats())
+            print("NOT found!")
+            return None
+        finally:
+            for keys in layers + runs:
+                keys.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def run_anytime(self, outputfile, weight=5.0, time_budget=None, max_expansions=None):
+        """
+        Anytime repairing A* (ARA*) over packed keys: weighted A* passes
+        with f = g + w * h, starting at w = weight and halving w - 1 after
+        each pass down to w = 1. Solutions are found as goals are generated,
+        and each pass only expands nodes with f below the best cost so far.
+        A node whose g improves after it was expanded in the current pass
+        is put aside (incons) and queued again for the next pass instead of
+        being expanded twice in one, so passes build on each other.
+
+        After each pass self.bound is min(w, cost / the lowest g + h over
+        the open and incons nodes), an upper bound on the solution cost over
+        the optimal one; it is 1 once the w = 1 pass is done. The search
+        also stops when time_budget seconds or max_expansions expansions
+        are used up, with the bound of the last pass.
+        Symmetry is not supported.
+        Returns the depth of the best solution found.
+        """
+        if self.symmetry:
+            raise ValueError("the anytime search does not support symmetry")
+        h = self.heuristic or key_manhattan
+        successors = self.timed("movegen", key_successors, materialize=True)
+        progress = self.progress
+        clock = time.perf_counter
+        deadline = None if time_budget is None else clock() + time_budget
+        start = self.currentState.board.getKey()
+        g = {start: 0}
+        parents = {start: None}
+        closed = set()
+        incons = set()
+        # (f, -g, key): lowest f first, then deepest.
+        frontier = [(weight * h(start), 0, start)]
+        best = start if key_is_goal(start) else None
+        cost = 0 if best is not None else float("inf")
+        w = weight
+        stopped = False
+        while not stopped:
+            while frontier and frontier[0][0] < cost:
+                f, depth, key = heappop(frontier)
+                if key in closed or -depth != g[key]:
+                    self.duplicates += 1
+                    continue
+                if (max_expansions is not None and self.step >= max_expansions
+                        or deadline is not None and clock() > deadline):
+                    heappush(frontier, (f, depth, key))
+                    stopped = True
+                    break
+                closed.add(key)
+                self.step += 1
+                new_g = g[key] + 1
+                for _, _, _, new_key in successors(key):
+                    self.generated += 1
+                    if new_g >= g.get(new_key, new_g + 1):
+                        self.duplicates += 1
+                        continue
+                    g[new_key] = new_g
+                    parents[new_key] = key
+                    if key_is_goal(new_key):
+                        if new_g < cost:
+                            cost = new_g
+                            best = new_key
+                    elif new_key in closed:
+                        incons.add(new_key)
+                    else:
+                        heappush(frontier, (new_g + w * h(new_key), -new_g, new_key))
+                if len(frontier) > self.frontier_peak:
+                    self.frontier_peak = len(frontier)
+                if progress is not None and self.step % self.progress_every == 0:
+                    progress(self.stats())
+            if best is None:
+                break
+            waiting = {key for _, depth, key in frontier if key not in closed and -depth == g[key]} | incons
+            lowest = min([g[key] + h(key) for key in waiting] + [cost])
+            proven = w if not stopped else (self.bound or float("inf"))
+            self.bound = min(proven, cost / lowest) if lowest else 1.0
+            if progress is not None:
+                progress(self.stats())
+            if stopped or w == 1:
+                break
+            w = 1 + (w - 1) / 2 if w > 1.05 else 1
+            frontier = [(g[key] + w * h(key), -g[key], key) for key in waiting]
+            heapify(frontier)
+            closed = set()
+            incons = set()
+        if best is None:
+            print("No solution within the budget" if stopped else "NOT found!")
+            return None
+        self.write_solution(self.trace_keys(parents, best), outputfile)
+        return cost
+
+    def run_A_star_puzzle(self, outputfile, puzzle):
+        """
+        A* on a Puzzle, as run_A_star_packed but on Puzzle keys, each queued
+        with its blanks, and with the distance of the goal piece from the
+        exit as the heuristic.
+        Returns the depth of the solution.
+        """
+        successors = self.timed("movegen", puzzle.successors, materialize=True)
+        h = puzzle.manhattan
+        frontier = BucketQueue()
+        push = self.timed("frontier", frontier.push)
+        pop = self.timed("frontier", frontier.pop)
+        progress = self.progress
+        start = puzzle.start
+        explored = {}
+        best = {start: 0}
+        def fresh(key, g):
+            if key in explored or best.get(key, g + 1) <= g:
+                return False
+            best[key] = g
+            return True
+        fresh = self.timed("dedup", fresh)
+        push(h(start), 0, (start, puzzle.start_blanks, None))
+        while frontier:
+            _, g, (key, blanks, parent) = pop()
+            if key in explored or best[key] != g:
+                self.duplicates += 1
+                continue
+            del best[key]
+            explored[key] = parent
+            if puzzle.is_goal(key):
+                path = []
+                while key is not None:
+                    path.append(key)
+                    key = explored[key]
+                self.write_solution(path[::-1], outputfile, puzzle)
+                return g
+            self.step += 1
+            for new_key, new_blanks in successors(key, blanks):
+                self.generated += 1
+                if fresh(new_key, g + 1):
+                    push(g + 1 + h(new_key), g + 1, (new_key, new_blanks, key))
+                else:
+                    self.duplicates += 1
+            if len(frontier) > self.frontier_peak:
+                self.frontier_peak = len(frontier)
+            if progress is not None and self.step % self.progress_every == 0:
+                progress(self.stats())
+        print("NOT found!")
+
+    def run_A_star_parallel(self, outputfile, workers=None, batch=500, heuristic="manhattan", pdb_dir=None):
+        """
+        Hash-distributed A* (in the style of HDA*) over packed keys.
+        Every key is owned by one worker process, chosen by key_owner. Each
+        worker keeps the open list and best g of its own keys, and sends
+        successors it does not own to their owner in batches.
+
+        The search runs in rounds driven by this process: every worker gets
+        its incoming batches and the cost of the best goal found so far,
+        expands up to batch nodes with f below that cost, and returns its
+        outgoing batches and the lowest f left on its open list. The
+        solution is optimal once a goal is known, no batch is in transit,
+        and no open list holds a node with lower f.
+        The heuristic is given by name ("manhattan" or "pdb" with the
+        tables in pdb_dir) and built inside each worker, since closures
+        cannot be pickled for spawned processes.
+        Returns the depth of the solution.
+        """
+        if self.symmetry:
+            raise ValueError("run_A_star_parallel does not support symmetry")
+        workers = workers or multiprocessing.cpu_count()
+        start = self.currentState.board.getKey()
+        conns = []
+        procs = []
+        for index in range(workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=_hda_worker, args=(index, workers, child_conn, heuristic, pdb_dir, start, batch))
+            proc.daemon = True
+            proc.start()
+            conns.append(parent_conn)
+            procs.append(proc)
+        try:
+            inboxes = [[] for _ in range(workers)]
+            inboxes[key_owner(start, workers)].append((start, 0, None))
+            best = None
+            while True:
+                bound = best[0] if best else float("inf")
+                for conn, inbox in zip(conns, inboxes):
+                    conn.send(("round", inbox, bound))
+                inboxes = [[] for _ in range(workers)]
+                in_transit = False
+                lowest = float("inf")
+                size = 0
+                for conn in conns:
+                    outgoing, goal, f, expanded, open_size = conn.recv()
+                    self.step += expanded
+                    size += open_size
+                    for owner, items in enumerate(outgoing):
+                        if items:
+                            inboxes[owner].extend(items)
+                            in_transit = True
+                    if goal is not None and (best is None or goal[0] < best[0]):
+                        best = goal
+                    if f is not None:
+                        lowest = min(lowest, f)
+                self.frontier_peak = max(self.frontier_peak, size)
+                if not in_transit and lowest >= (best[0] if best else float("inf")):
+                    break
+            if best is None:
+                print("NOT found!")
+                return None
+            path = []
+            key = best[1]
+            while key is not None:
+                path.append(key)
+                conn = conns[key_owner(key, workers)]
+                conn.send(("parent", key))
+                key = conn.recv()
+            self.write_solution(path[::-1], outputfile)
+            return best[0]
+        finally:
+            for conn in conns:
+                conn.send(("stop",))
+            for proc in procs:
+                proc.join()
+
+    def trace_moves(self, explored, key):
+        """
+        Follow the (parent key, move) records back from key and return the
+        moves from the start.
+        """
+        moves = []
+        parent, move = explored[self.key_of(key)]
+        while parent is not None:
+            moves.append(move)
+            parent, move = explored[self.key_of(parent)]
+        return moves[::-1]
+
+    def write_solution(self, keys, outputfile, puzzle=None):
+        """
+        Keep the solution path (packed keys, or keys of puzzle) in
+        self.solution and write it.
+        """
+        self.solution = keys
+        keys_to_file(keys, outputfile, self.output_format, puzzle)
+
+    def replay_to_file(self, start, moves, outputfile):
+        """
+        Replay (x, y, dir) moves from the start key on a fresh board and
+        write every position to outputfile.
+        """
+        board = board_from_key(start)
+        keys = [start]
+        for x, y, dir in moves:
+            for i, piece in enumerate(board.pieces):
+                if piece.coord_x == x and piece.coord_y == y:
+                    break
+            board.move(board.pieces, i, board_type(piece), dir)
+            keys.append(board.getKey())
+        self.write_solution(keys, outputfile)
+
+    def trace_keys(self, parents, key):
+        """
+        Follow the parent map back from key and return the path from the start.
+        Parents are stored as the actual keys that were expanded, so the path
+        comes out un-mirrored even when the explored set is canonical.
+        """
+        path = []
+        while key is not None:
+            path.append(key)
+            key = parents[self.key_of(key)]
+        return path[::-1]
+
+    def frontier_to_file(self, filename, algo):
+        out = ["\nBegin frontier\n"]
+        if algo == "DFS":
+            entries = [("%d \n" % j, states) for j, states in enumerate(self.frontierList)]
+        else:
+            entries = [("%d: %d\n\n" % (j, heu), states) for j, (heu, _, states) in enumerate(self.frontierList)]
+        for label, states in entries:
+            out.append(label)
+            for line in states.board.grid:
+                out.append("".join(line) + "\n")
+            out.append("\n")
+            if self.rep_of(states.board.getStringRep()) in self.exploredSet:
+                out.append("NOOOOOOOOO\n")
+        out.append("frontier done")
+        with open(filename, "a") as f:
+            f.write("".join(out))
+    
+    def output_to_file(self, state, filename):
+        """
+        Write state to file
+        """
+        out = ["\n\nExploring:\n"]
+        for line in state.board.grid:
+            out.append("".join(line) + "\n")
+        with open(filename, "a") as f:
+            f.write("".join(out))
+        
+
+def read_from_file(filename):
+    """
+    Load initial board from a given file. Files with header lines are
+    variants read by parse_puzzle, the others classic boards.
+
+    :param filename: The name of the given file.
+    :type filename: str
+    :return: A loaded board
+    :rtype: Union[Board, Puzzle]
+    """
+
+    puzzle_file = open(filename, "r")
+    lines = puzzle_file.readlines()
+    puzzle_file.close()
+
+    if any(":" in line for line in lines):
+        return parse_puzzle(lines)
+    return parse_layout(lines)
+
+
+def parse_layout(lines):
+    """
+    Like parse_board, but first check that the lines describe a legal
+    board: HEIGHT rows of WIDTH cells, every cell one of GLYPHS, whole
+    pieces that do not overlap, and exactly one goal piece.
+
+    :param lines: The rows of the puzzle.
+    :type lines: Iterable[str]
+    :return: A loaded board
+    :rtype: Board
+    :raises ValueError: If the layout is malformed.
+    """
+    rows = [line.rstrip("\r\n") for line in lines]
+    while rows and not rows[-1].strip():
+        rows.pop(-1)
+    if len(rows) != HEIGHT or any(len(row) != WIDTH for row in rows):
+        raise ValueError("malformed layout: expected {} rows of {} cells".format(HEIGHT, WIDTH))
+    rep = "".join(rows)
+    for ch in rep:
+        if ch not in CODE:
+            raise ValueError("malformed layout: unknown cell {!r}".format(ch))
+    if rep.count(char_goal) != 4:
+        raise ValueError("malformed layout: expected one 2x2 goal piece")
+    try:
+        board = parse_board(rows)
+    except IndexError:
+        raise ValueError("malformed layout: a piece runs off the board")
+    occupied = 0
+    for piece in board.pieces:
+        cells = SHAPE_CELLS.get((board_type(piece), piece.coord_y * WIDTH + piece.coord_x))
+        if cells is None:
+            raise ValueError("malformed layout: a piece runs off the board")
+        if occupied & cells:
+            raise ValueError("malformed layout: overlapping pieces")
+        occupied |= cells
+    # Broken or extra pieces do not draw back the same grid.
+    if board.getStringRep() != rep:
+        raise ValueError("malformed layout: broken pieces")
+    return board
+
+
+def parse_board(lines):
+    """
+    Build a board from the lines of a puzzle (same format as the input file).
+
+    :param lines: The rows of the puzzle.
+    :type lines: Iterable[str]
+    :return: A loaded board
+    :rtype: Board
+    """
+
+    line_index = 0
+    pieces = []
+    g_found = False
+
+    for line in lines:
+
+        for x, ch in enumerate(line):
+            if ch == '^': # found vertical piece
+                pieces.append(Piece(False, False, x, line_index, 'v'))
+            elif ch == '<': # found horizontal piece
+                pieces.append(Piece(False, False, x, line_index, 'h'))
+            elif ch == char_single:
+                pieces.append(Piece(False, True, x, line_index, None))
+            elif ch == char_goal:
+                if g_found == False:
+                    pieces.append(Piece(True, False, x, line_index, None))
+                    g_found = True
+
+        line_index += 1
+
+    board = Board(pieces)
+    
+    return board
+
+
+def key_owner(key, workers):
+    """
+    The worker owning key in run_A_star_parallel (a multiplicative hash,
+    since the low bits of a key only describe the top left cell).
+    """
+    return ((key * 0x9E3779B97F4A7C15) >> 64) % workers
+
+
+def _hda_worker(index, workers, conn, heuristic, pdb_dir, start, batch):
+    """
+    Worker process of Solvers.run_A_star_parallel. best maps each owned key
+    to its (g, parent key); an open entry whose g is no longer the best is
+    stale and skipped. A better g reopens a key, since another worker may
+    have expanded it first on a worse path. The pattern databases for
+    heuristic "pdb" are loaded here for the piece counts of start.
+    """
+    h = pdb_heuristic(start, pdb_dir) if heuristic == "pdb" else key_manhattan
+    counter = itertools.count()
+    frontier = []
+    best = {}
+    while True:
+        message = conn.recv()
+        if message[0] == "stop":
+            break
+        if message[0] == "parent":
+            conn.send(best[message[1]][1])
+            continue
+        _, incoming, bound = message
+        for key, g, parent in incoming:
+            old = best.get(key)
+            if old is None or g < old[0]:
+                best[key] = (g, parent)
+                heappush(frontier, (g + h(key), next(counter), g, key))
+        outgoing = [[] for _ in range(workers)]
+        goal = None
+        expanded = 0
+        while frontier and expanded < batch and frontier[0][0] < bound:
+            _, _, g, key = heappop(frontier)
+            if best[key][0] != g:
+                continue
+            expanded += 1
+            if key_is_goal(key):
+                if goal is None or g < goal[0]:
+                    goal = (g, key)
+                    bound = g
+                continue
+            for _, _, _, new_key in key_successors(key):
+                owner = key_owner(new_key, workers)
+                if owner != index:
+                    outgoing[owner].append((new_key, g + 1, key))
+                    continue
+                old = best.get(new_key)
+                if old is None or g + 1 < old[0]:
+                    best[new_key] = (g + 1, key)
+                    heappush(frontier, (g + 1 + h(new_key), next(counter), g + 1, new_key))
+        conn.send((outgoing, goal, frontier[0][0] if frontier else None, expanded, len(frontier)))
+
+
+def key_rep(key):
+    """
+    Return the string rep (as Board.getStringRep) of a packed key.
+    """
+    return "".join("".join(line) for line in unpack_key(key))
+
+
+def rep_key(rep):
+    """
+    Return the packed key of a string rep.
+    """
+    return pack_grid([rep])
+
+
+class SolutionCache:
+    """
+    On-disk (SQLite) cache of solved positions, keyed by canonical_rep.
+
+    Each row stores the next position on a solution from its board, the
+    remaining depth, the algorithm that found it, and whether it is optimal.
+    A solution is stored as one row per position, so every intermediate
+    position of an optimal solution gets its own optimal suffix. A path is
+    read back by following next until depth 0. Next positions are stored in
+    the orientation of the canonical board, and mirrored back on lookup when
+    the query board is the mirror image.
+
+    The table is kept to max_entries rows by evicting the least recently
+    used ones; a lookup refreshes every row of its chain. A chain that lost
+    a row to eviction reads as a miss.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS solutions (
+            board TEXT PRIMARY KEY,
+            next TEXT,
+            depth INTEGER NOT NULL,
+            algo TEXT NOT NULL,
+            optimal INTEGER NOT NULL,
+            used REAL NOT NULL
+        )
+    """
+
+    # filename -> open cache, so a process connects once.
+    opened = {}
+
+    def __init__(self, filename, max_entries=1000000):
+        """
+        Use SolutionCache.open to share connections within a process.
+
+        :param filename: The SQLite database file.
+        :type filename: str
+        :param max_entries: The number of positions kept.
+        :type max_entries: int
+        """
+        self.db = sqlite3.connect(filename, timeout=30)
+        self.db.execute(self.SCHEMA)
+        self.db.execute("CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)")
+        self.db.commit()
+        self.max_entries = max_entries
+
+    @classmethod
+    def open(cls, filename, max_entries=1000000):
+        if filename not in cls.opened:
+            cls.opened[filename] = cls(filename, max_entries)
+        cache = cls.opened[filename]
+        cache.max_entries = max_entries
+        return cache
+
+    def lookup(self, key, optimal):
+        """
+        Return the cached path (packed keys) from key to a goal, or None.
+        With optimal set, only optimal solutions are returned.
+        """
+        path = [key]
+        canons = []
+        depth = None
+        while True:
+            rep = key_rep(key)
+            canon = canonical_rep(rep)
+            row = self.db.execute(
+                "SELECT next, depth, optimal FROM solutions WHERE board = ?", (canon,)).fetchone()
+            if row is None or (optimal and not row[2]):
+                return None
+            canons.append(canon)
+            if depth is None:
+                depth = row[1]
+            if row[0] is None:
+                break
+            if len(path) > depth:
+                return None
+            next = row[0] if canon == rep else mirror_rep(row[0])
+            key = rep_key(next)
+            path.append(key)
+        # Every row of the chain is used, so none is evicted before the first.
+        now = time.time()
+        self.db.executemany("UPDATE solutions SET used = ? WHERE board = ?", [(now, canon) for canon in canons])
+        self.db.commit()
+        return path
+
+    def store(self, path, algo, optimal):
+        """
+        Store a solution path (packed keys, start first). Rows of optimal
+        solutions replace existing rows; other rows never replace any.
+        """
+        now = time.time()
+        rows = []
+        reps = self.without_loops([key_rep(key) for key in path])
+        for i, rep in enumerate(reps):
+            canon = canonical_rep(rep)
+            next = None
+            if i + 1 < len(reps):
+                next = reps[i + 1] if canon == rep else mirror_rep(reps[i + 1])
+            rows.append((canon, next, len(reps) - 1 - i, algo, int(optimal), now))
+        verb = "INSERT OR REPLACE" if optimal else "INSERT OR IGNORE"
+        self.db.executemany(verb + " INTO solutions VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self.evict()
+        self.db.commit()
+
+    @staticmethod
+    def without_loops(reps):
+        """
+        Cut the loops out of a path of string reps, so that no two
+        positions share a canonical rep (one row each). From every position
+        the path jumps past the last one with the same canonical rep; if
+        that one is the mirror image, the rest of the path is mirrored.
+        """
+        last = {canonical_rep(rep): i for i, rep in enumerate(reps)}
+        kept = []
+        flip = False
+        i = 0
+        while i < len(reps):
+            rep = mirror_rep(reps[i]) if flip else reps[i]
+            j = last[canonical_rep(rep)]
+            if (mirror_rep(reps[j]) if flip else reps[j]) != rep:
+                flip = not flip
+            kept.append(rep)
+            i = j + 1
+        return kept
+
+    def evict(self):
+        """
+        Drop the least recently used rows beyond max_entries.
+        """
+        count = self.db.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+        if count > self.max_entries:
+            self.db.execute(
+                "DELETE FROM solutions WHERE board IN "
+                "(SELECT board FROM solutions ORDER BY used LIMIT ?)", (count - self.max_entries,))
+
+
+PDB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdb")
+
+
+def solve(board, outputfile, algo, engine="board", symmetry=False, heuristic="manhattan", pdb_dir=PDB_DIR, workers=None,
+          cache=None, cache_size=1000000, stats=None, progress=None, output_format="grids", tt_size=100000,
+          visited="set", precheck=False, weight=5.0, time_budget=None, max_expansions=None, depth_limit=None,
+          deepen=False, workdir=None, run_size=1 << 20):
+    """
+    Solve board and write the solution to outputfile.
+
+    :param algo: One of ALGOS.
+    :param engine: 'board' (copy a Board per State), 'packed', 'inplace',
+        'hda' (A* only, over workers processes) or 'generic' (A* only, on
+        the Puzzle of the board, see generic_error). idastar always works
+        in place, bidir, anytime and external always on packed keys and bfs
+        on numpy arrays of them.
+    :param heuristic: 'manhattan' or 'pdb', for A* and IDA*.
+    :param cache: A SolutionCache file checked before and filled after the search.
+    :param stats: A file ('-' for stdout) receiving the search counters and
+        phase timings as JSON.
+    :param progress: Called with the counters every 10000 expansions.
+    :param output_format: 'grids' or 'moves' (see solution_lines).
+    :param tt_size: The number of keys kept in the IDA* transposition table.
+    :param visited: The explored set backend of the board engine and of
+        in place DFS (see VISITED). bloom may miss solutions, dfs only.
+    :param precheck: Skip the search when solvable says the goal cannot
+        be reached.
+    :param weight: The first weight of the anytime search.
+    :param time_budget: Seconds allowed to the anytime search.
+    :param max_expansions: Expansions allowed to the anytime search.
+    :param depth_limit: The deepest solution dfs looks for.
+    :param deepen: Run dfs by iterative deepening, so it finds an optimal
+        solution (up to depth_limit if given).
+    :param workdir: Where the external search writes its layers (default:
+        the system temporary directory).
+    :param run_size: The most keys the external search sorts in memory.
+    :return: The depth of the solution, or None if there is none.
+    """
+    if engine == "generic" or isinstance(board, Puzzle):
+        error = generic_error(algo, symmetry, heuristic, cache, precheck, engine)
+        if error is not None:
+            raise ValueError(error)
+    solutions = None
+    if cache is not None:
+        optimal = algo != "dfs" or deepen
+        solutions = SolutionCache.open(cache, cache_size)
+        path = solutions.lookup(board.getKey(), optimal)
+        if path is not None:
+            keys_to_file(path, outputfile, output_format)
+            if stats is not None:
+                write_stats({"cache": "hit", "depth": len(path) - 1}, stats)
+            return len(path) - 1
+    # Searches print "NOT found!"; keep that out of stats written to stdout.
+    quiet = contextlib.redirect_stdout(sys.stderr) if stats == "-" else contextlib.nullcontext()
+    with quiet:
+        unsolvable = precheck and not solvable(board.getKey(), pdb_dir)
+        if unsolvable:
+            print("NOT found!")
+        else:
+            solvers = search(board, outputfile, algo, engine, symmetry, heuristic, pdb_dir, workers,
+                             timing=stats is not None, progress=progress, output_format=output_format,
+                             tt_size=tt_size, visited=visited, weight=weight, time_budget=time_budget,
+                             max_expansions=max_expansions, depth_limit=depth_limit, deepen=deepen,
+                             workdir=workdir, run_size=run_size)
+    if unsolvable:
+        if stats is not None:
+            write_stats({"precheck": "unsolvable", "depth": None}, stats)
+        return None
+    if solutions is not None and solvers.solution is not None:
+        solutions.store(solvers.solution, algo, proven_optimal(algo, solvers))
+    if stats is not None:
+        write_stats(solvers.stats(), stats)
+    return solvers.depth
+
+
+def write_stats(stats, filename):
+    """
+    Write a stats dict as JSON to filename, or to stdout for '-'.
+    """
+    text = json.dumps(stats, indent=1)
+    if filename == "-":
+        print(text)
+    else:
+        with open(filename, "w") as f:
+            f.write(text + "\n")
+
+
+def generic_error(algo, symmetry, heuristic, cache=None, precheck=False, engine="generic"):
+    """
+    Return why the options cannot run on the generic engine (Puzzle), or
+    None if they can: it only has A* with its own Manhattan heuristic,
+    and no other engine, symmetry, solution cache or solvability table.
+    engine "board" is the default of solve and stands for no engine asked.
+    """
+    if engine not in ("board", "generic"):
+        return "the generic engine does not support --packed, --inplace or --hda"
+    if algo != "astar":
+        return "the generic engine only runs --algo astar"
+    if symmetry or heuristic != "manhattan":
+        return "the generic engine does not support --symmetry or --heuristic pdb"
+    if cache is not None or precheck:
+        return "the generic engine does not support --cache or --precheck"
+    return None
+
+
+def proven_optimal(algo, solvers):
+    """
+    Whether the solution found by search is known to be optimal.
+    """
+    if algo in ("anytime", "dfs"):
+        return solvers.bound == 1
+    return True
+
+
+def search(board, outputfile, algo, engine, symmetry, heuristic, pdb_dir, workers, timing=False, progress=None,
+           output_format="grids", tt_size=100000, visited="set", weight=5.0, time_budget=None, max_expansions=None,
+           depth_limit=None, deepen=False, workdir=None, run_size=1 << 20):
+    """
+    Run the search selected by the solve options and return the Solvers,
+    with the depth found (None if unsolved) in Solvers.depth.
+    """
+    start = time.perf_counter()
+    if engine == "generic" or isinstance(board, Puzzle):
+        puzzle = board if isinstance(board, Puzzle) else Puzzle.from_board(board)
+        solvers = Solvers(None, timing=timing, progress=progress, output_format=output_format)
+        solvers.depth = solvers.run_A_star_puzzle(outputfile, puzzle)
+        solvers.elapsed = time.perf_counter() - start
+        return solvers
+    if algo == "table":
+        solvers = Solvers(State(board, 0, 0, None), output_format=output_format)
+        solvers.depth = solvers.run_table(outputfile, PatternDatabase.load("exact", board.getKey(), pdb_dir))
+        solvers.elapsed = time.perf_counter() - start
+        return solvers
+    h = None
+    if heuristic == "pdb":
+        h = pdb_heuristic(board.getKey(), pdb_dir)
+    solvers = Solvers(State(board, 0, 0, None), symmetry=symmetry, heuristic=h,
+                      timing=timing, progress=progress, output_format=output_format, visited=visited)
+    if algo == "idastar":
+        solvers.depth = solvers.run_IDA_star(outputfile, tt_size)
+    elif algo == "bidir":
+        solvers.depth = solvers.run_bidirectional(outputfile)
+    elif algo == "bfs":
+        solvers.depth = solvers.run_BFS_layers(outputfile)
+    elif algo == "external":
+        solvers.depth = solvers.run_BFS_external(outputfile, workdir, run_size)
+    elif algo == "anytime":
+        solvers.depth = solvers.run_anytime(outputfile, weight, time_budget, max_expansions)
+    elif algo == "dfs":
+        if engine == "packed":
+            dfs = solvers.run_DFS_packed
+        elif engine == "inplace":
+            dfs = solvers.run_DFS_inplace
+        else:
+            dfs = solvers.run_DFS
+        if deepen:
+            solvers.depth = solvers.run_deepening(dfs, outputfile, depth_limit)
+        else:
+            solvers.depth = dfs(outputfile, depth_limit)
+            if solvers.depth is None and depth_limit is not None:
+                print("No solution within {} moves".format(depth_limit))
+    elif engine == "packed":
+        solvers.depth = solvers.run_A_star_packed(outputfile)
+    elif engine == "inplace":
+        solvers.depth = solvers.run_A_star_inplace(outputfile)
+    elif engine == "hda":
+        solvers.depth = solvers.run_A_star_parallel(outputfile, workers, heuristic=heuristic, pdb_dir=pdb_dir)
+    else:
+        solvers.depth = solvers.run_A_star(outputfile)
+    solvers.elapsed = time.perf_counter() - start
+    return solvers
+
+
+def solve_file(job):
+    """
+    Pool worker: solve one (inputfile, outputfile, options) job.
+    Returns (inputfile, status, depth, seconds).
+    """
+    inputfile, outputfile, options = job
+    start = time.time()
+    try:
+        depth = solve(read_from_file(inputfile), outputfile, **options)
+    except Exception as e:
+        return inputfile, "error: {}".format(e), None, time.time() - start
+    status = "solved" if depth is not None else "unsolved"
+    return inputfile, status, depth, time.time() - start
+
+
+def batch_inputs(pattern):
+    """
+    Return the puzzle files named by a directory or a glob pattern.
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*")
+    return sorted(f for f in glob.glob(pattern) if os.path.isfile(f))
+
+
+def run_batch(inputs, outdir, options, workers=None):
+    """
+    Solve every input file over a pool of worker processes, writing
+    <outdir>/<input name>.sol for each, and print one line per puzzle:
+    input, status, depth and time. Returns the list of results.
+    """
+    os.makedirs(outdir, exist_ok=True)
+    jobs = []
+    for inputfile in inputs:
+        name = os.path.splitext(os.path.basename(inputfile))[0]
+        jobs.append((inputfile, os.path.join(outdir, name + ".sol"), options))
+    results = []
+    with multiprocessing.Pool(workers) as pool:
+        for inputfile, status, depth, seconds in pool.imap_unordered(solve_file, jobs):
+            print("{}\t{}\t{}\t{:.3f}s".format(inputfile, status, "-" if depth is None else depth, seconds))
+            sys.stdout.flush()
+            results.append((inputfile, status, depth, seconds))
+    return results
+
+
+ALGOS = ('astar', 'idastar', 'bidir', 'bfs', 'external', 'anytime', 'dfs', 'table')
+ENGINES = ('board', 'packed', 'inplace', 'hda', 'generic')
+
+
+class SolverService:
+    """
+    A resident solver answering JSON lines requests (see --serve), so the
+    interpreter, the pattern databases and the solutions found stay warm
+    between puzzles.
+
+    A request is an object with "board", the rows of the puzzle as a list
+    or one newline separated string, and optionally "id" (echoed back) and
+    "algo", "engine", "heuristic", "symmetry" or "format" overriding the
+    service options. It is answered by zero or more {"id", "solution"}
+    messages carrying the text of the solution (see solution_lines) in
+    chunks of STREAM_STEPS positions, then one {"id", "status"} message
+    with status "solved" (with "depth" and "cached"), "unsolvable" or
+    "error" (with "error").
+
+    Solutions are stored in a SolutionCache (in memory unless a file is
+    given), so every position on a solved path is answered from it later.
+    The last answers given are also kept ready to send, up to answer_size.
+    Searches run one at a time in a worker thread, so cached positions are
+    answered while a search is running.
+    """
+
+    def __init__(self, options, cache=None, cache_size=1000000, answer_size=10000):
+        """
+        :param options: The solve options (see solve) used by default.
+        :type options: dict
+        :param cache: A SolutionCache file, or None to keep it in memory.
+        :type cache: Optional[str]
+        """
+        self.options = options
+        self.solutions = SolutionCache.open(cache or ":memory:", cache_size)
+        self.answers = {}    # (key, format, optimal) -> (depth, solution chunks), oldest first
+        self.answer_size = answer_size
+        self.searches = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def request_options(self, request):
+        """
+        Return the solve options of request, raising ValueError on bad ones.
+        """
+        options = dict(self.options)
+        for name, option, choices in (("algo", "algo", ALGOS), ("engine", "engine", ENGINES),
+                                      ("heuristic", "heuristic", ("manhattan", "pdb")),
+                                      ("format", "output_format", ("grids", "moves"))):
+            if name in request:
+                if request[name] not in choices:
+                    raise ValueError("{} must be one of {}".format(name, ", ".join(choices)))
+                options[option] = request[name]
+        if "symmetry" in request:
+            options["symmetry"] = bool(request["symmetry"])
+        if options["engine"] == "generic":
+            raise ValueError("the service does not run the generic engine")
+        return options
+
+    def search(self, board, options):
+        """
+        Solve board in the search thread. Returns the path and whether it
+        is optimal, or None if no solution was found.
+        """
+        key = board.getKey()
+        if not solvable(key, options["pdb_dir"]):
+            return None
+        solvers = search(board, os.devnull, options["algo"], options["engine"], options["symmetry"],
+                         options["heuristic"], options["pdb_dir"], options.get("workers"),
+                         tt_size=options.get("tt_size", 100000), visited=options.get("visited", "set"),
+                         weight=options.get("weight", 5.0), time_budget=options.get("time_budget"),
+                         max_expansions=options.get("max_expansions"), depth_limit=options.get("depth_limit"),
+                         deepen=options.get("deepen", False), workdir=options.get("workdir"),
+                         run_size=options.get("run_size", 1 << 20))
+        if solvers.solution is None:
+            if options["algo"] == "anytime":
+                raise ValueError("no solution within the budget")
+            return None
+        return solvers.solution, proven_optimal(options["algo"], solvers)
+
+    async def answer(self, request):
+        """
+        Return the messages answering one decoded request.
+        """
+        id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict) or "board" not in request:
+                raise ValueError("a request is an object with a board")
+            rows = request["board"]
+            if isinstance(rows, str):
+                rows = rows.split("\n")
+            board = parse_layout(rows)
+            options = self.request_options(request)
+        except (TypeError, ValueError) as e:
+            return [{"id": id, "status": "error", "error": str(e)}]
+        key = board.getKey()
+        optimal = options["algo"] != "dfs" or options.get("deepen", False)
+        format = options["output_format"]
+        cached = True
+        found = self.answers.pop((key, format, optimal), None)
+        if found is None:
+            path = self.solutions.lookup(key, optimal)
+            if path is None:
+                cached = False
+                loop = asyncio.get_running_loop()
+                try:
+                    found = await loop.run_in_executor(self.searches, self.search, board, options)
+                except Exception as e:
+                    return [{"id": id, "status": "error", "error": str(e)}]
+                if found is None:
+                    return [{"id": id, "status": "unsolvable"}]
+                path, optimal = found
+                self.solutions.store(path, options["algo"], optimal)
+            lines = solution_lines(path, format)
+            chunks = []
+            while True:
+                chunk = "".join(itertools.islice(lines, STREAM_STEPS))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            found = (len(path) - 1, chunks)
+            if len(self.answers) >= self.answer_size:
+                del self.answers[next(iter(self.answers))]
+        self.answers[key, format, optimal] = found
+        depth, chunks = found
+        messages = [{"id": id, "solution": chunk} for chunk in chunks]
+        messages.append({"id": id, "status": "solved", "depth": depth, "cached": cached})
+        return messages
+
+    async def client(self, reader, writer):
+        """
+        Answer the requests of one connection, in order, until it closes.
+        """
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                messages = [{"id": None, "status": "error", "error": "bad request: {}".format(e)}]
+            else:
+                messages = await self.answer(request)
+            for message in messages:
+                writer.write((json.dumps(message) + "\n").encode())
+            await writer.drain()
+        writer.close()
+
+    async def serve(self, path=None):
+        """
+        Serve clients on the Unix socket path, or stdin/stdout if None.
+        """
+        if path is not None:
+            server = await asyncio.start_unix_server(self.client, path)
+            async with server:
+                await server.serve_forever()
+            return
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        # Searches print "NOT found!"; keep that out of the answers.
+        sys.stdout = sys.stderr
+        await self.client(reader, writer)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--inputfile",
+        type=str,
+        help="The input file that contains the puzzle."
+    )
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        help="The output file that contains the solution."
+    )
+    parser.add_argument(
+        "--algo",
+        type=str,
+        choices=ALGOS,
+        help="The searching algorithm. idastar is A* in memory proportional to the solution"
+             " depth, bidir is breadth first from both the start and the goal boards,"
+             " bfs is breadth first a whole layer at a time with numpy, external is breadth"
+             " first with its layers in files on disk, anytime is weighted"
+             " A* improving its solution until the budget runs out,"
+             " table looks moves up in the exact distance table."
+    )
+    engine = parser.add_mutually_exclusive_group()
+    engine.add_argument(
+        "--packed",
+        action="store_true",
+        help="Search over packed integer keys instead of copying boards."
+    )
+    engine.add_argument(
+        "--inplace",
+        action="store_true",
+        help="Make and undo moves on one board, storing only keys and a move log."
+    )
+    engine.add_argument(
+        "--hda",
+        action="store_true",
+        help="Hash-distribute A* over --workers processes."
+    )
+    engine.add_argument(
+        "--generic",
+        action="store_true",
+        help="Run A* on the data-driven engine that variant puzzles (input files with headers) always use."
+    )
+    parser.add_argument(
+        "--symmetry",
+        action="store_true",
+        help="Treat a board and its left-right mirror as the same explored state."
+    )
+    parser.add_argument(
+        "--heuristic",
+        type=str,
+        default="manhattan",
+        choices=['manhattan', 'pdb'],
+        help="The A* heuristic. pdb tables are built on first use and reused."
+    )
+    parser.add_argument(
+        "--tt-size",
+        type=int,
+        default=100000,
+        help="The number of positions kept in the idastar transposition table."
+    )
+    parser.add_argument(
+        "--weight",
+        type=float,
+        default=5.0,
+        help="The first heuristic weight of --algo anytime, lowered toward 1 after each solution."
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        help="Seconds --algo anytime may search before returning its best solution."
+    )
+    parser.add_argument(
+        "--max-expansions",
+        type=int,
+        help="Expansions --algo anytime may use before returning its best solution."
+    )
+    parser.add_argument(
+        "--depth-limit",
+        type=int,
+        help="The deepest solution --algo dfs looks for."
+    )
+    parser.add_argument(
+        "--deepen",
+        action="store_true",
+        help="Run --algo dfs by iterative deepening, raising the depth limit by one until a solution,"
+             " an optimal one, is found."
+    )
+    parser.add_argument(
+        "--workdir",
+        type=str,
+        help="The directory under which --algo external writes its layer files (default: the system"
+             " temporary directory)."
+    )
+    parser.add_argument(
+        "--run-size",
+        type=int,
+        default=1 << 20,
+        help="The most successors --algo external sorts in memory before writing them to disk."
+    )
+    parser.add_argument(
+        "--visited",
+        type=str,
+        default="set",
+        choices=sorted(VISITED),
+        help="The explored set of the board engine and of --inplace dfs: a set of strings,"
+             " a hash table of packed keys, or (dfs only, may miss solutions) a Bloom filter."
+    )
+    parser.add_argument(
+        "--pdb-dir",
+        type=str,
+        default=PDB_DIR,
+        help="The directory holding the pattern database and distance tables."
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only print whether the input is solvable (see --precheck) and exit, 1 if it is not."
+    )
+    parser.add_argument(
+        "--precheck",
+        action="store_true",
+        help="Look the input up in the exact distance table (built on first use) and skip"
+             " the search if the goal cannot be reached."
+    )
+    parser.add_argument(
+        "--build-table",
+        action="store_true",
+        help="(Re)build the exact distance table for the input's piece set and exit."
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        help="A SQLite solution cache checked before and filled after each search."
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1000000,
+        help="The number of positions kept in --cache (least recently used are evicted)."
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        default="grids",
+        choices=['grids', 'moves'],
+        help="Write every position of the solution, or one '<type> <x> <y> <dir>' line per move."
+    )
+    parser.add_argument(
+        "--stats",
+        type=str,
+        help="Write search counters and phase timings as JSON to this file ('-' for stdout)."
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Print the search counters to stderr every 10000 expansions."
+    )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        help="A directory or glob of puzzle files to solve instead of --inputfile."
+    )
+    parser.add_argument(
+        "--outdir",
+        type=str,
+        default=".",
+        help="With --batch, the directory receiving one <name>.sol per puzzle."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes for --batch or --hda (default: all cores)."
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Answer JSON lines solve requests on --socket, or stdin/stdout (see SolverService)."
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        help="With --serve, the Unix socket to listen on."
+    )
+    args = parser.parse_args()
+    if [args.inputfile, args.batch, args.serve or None].count(None) != 2:
+        parser.error("exactly one of --inputfile, --batch and --serve is required")
+    if args.batch is not None and args.algo is None:
+        parser.error("--algo is required with --batch")
+    if args.batch is not None and args.hda:
+        parser.error("--hda cannot be combined with --batch")
+    if args.hda and args.algo != "astar":
+        parser.error("--hda requires --algo astar")
+    if args.hda and args.symmetry:
+        parser.error("--hda does not support --symmetry")
+    if args.packed and args.algo == "idastar":
+        parser.error("--algo idastar searches in place and cannot use --packed")
+    if args.algo == "bfs" and numpy is None:
+        parser.error("--algo bfs requires numpy")
+    if args.visited != "set" and (args.packed or args.hda or args.algo not in ("astar", "dfs")
+                                  or (args.inplace and args.algo != "dfs")):
+        parser.error("--visited applies to astar and dfs on the board engine and to --inplace dfs")
+    if args.visited == "bloom" and args.algo != "dfs":
+        parser.error("--visited bloom is only allowed with --algo dfs")
+    if (args.inputfile is not None and not (args.build_table or args.check)
+            and (args.outputfile is None or args.algo is None)):
+        parser.error("--outputfile and --algo are required unless --build-table or --check is given")
+    if args.tt_size < 1:
+        parser.error("--tt-size must be positive")
+    if args.weight < 1:
+        parser.error("--weight must be at least 1")
+    if args.algo == "anytime" and args.symmetry:
+        parser.error("--algo anytime does not support --symmetry")
+    if (args.depth_limit is not None or args.deepen) and args.algo != "dfs":
+        parser.error("--depth-limit and --deepen require --algo dfs")
+    if args.depth_limit is not None and args.depth_limit < 0:
+        parser.error("--depth-limit must not be negative")
+    if (args.depth_limit is not None or args.deepen) and args.visited != "set":
+        parser.error("--depth-limit and --deepen keep the depth of every board and need --visited set")
+    if args.run_size < 1:
+        parser.error("--run-size must be positive")
+    if args.socket is not None and not args.serve:
+        parser.error("--socket requires --serve")
+    if args.generic and args.serve:
+        parser.error("--generic cannot be combined with --serve")
+    if args.generic and args.algo is not None:
+        error = generic_error(args.algo, args.symmetry, args.heuristic, args.cache, args.precheck)
+        if error is not None:
+            parser.error(error)
+
+    engine = "board"
+    if args.packed:
+        engine = "packed"
+    elif args.inplace:
+        engine = "inplace"
+    elif args.hda:
+        engine = "hda"
+    elif args.generic:
+        engine = "generic"
+    options = dict(algo=args.algo, engine=engine, symmetry=args.symmetry,
+                   heuristic=args.heuristic, pdb_dir=args.pdb_dir,
+                   cache=args.cache, cache_size=args.cache_size, output_format=args.format,
+                   tt_size=args.tt_size, visited=args.visited, precheck=args.precheck,
+                   weight=args.weight, time_budget=args.time_budget, max_expansions=args.max_expansions,
+                   depth_limit=args.depth_limit, deepen=args.deepen, workdir=args.workdir,
+                   run_size=args.run_size)
 
+    if args.serve:
+        if options["algo"] is None:
+            options["algo"] = "astar"
+        cache = options.pop("cache")
+        cache_size = options.pop("cache_size")
+        options["workers"] = args.workers
+        service = SolverService(options, cache, cache_size)
+        try:
+            asyncio.run(service.serve(args.socket))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
 
+    if args.batch is not None:
+        run_batch(batch_inputs(args.batch), args.outdir, options, args.workers)
+        sys.exit(0)
 
+    try:
+        board = read_from_file(args.inputfile)
+    except ValueError as e:
+        sys.exit("{}: {}".format(args.inputfile, e))
+    if isinstance(board, Puzzle):
+        if args.check or args.build_table:
+            parser.error("--check and --build-table need a classic board")
+        error = generic_error(args.algo, args.symmetry, args.heuristic, args.cache, args.precheck, engine)
+        if error is not None:
+            parser.error(error)
+    if args.check:
+        result = solvable(board.getKey(), args.pdb_dir)
+        print("solvable" if result else "unsolvable")
+        sys.exit(0 if result else 1)
+    if args.build_table:
+        PatternDatabase.load("exact", board.getKey(), args.pdb_dir, rebuild=True)
+        sys.exit(0)
+    progress = None
+    if args.progress:
+        progress = lambda stats: print(json.dumps(stats), file=sys.stderr)
+    solve(board, args.outputfile, workers=args.workers, stats=args.stats, progress=progress, **options)